@@ -1,37 +1,49 @@
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
-try:
-    from flask_session import Session
-except ImportError:
-    # Fallback for different flask-session versions
-    import flask_session
-    Session = getattr(flask_session, 'Session', None)
-    if Session is None:
-        # If Session is not available, we'll use a simple in-memory session
-        class Session:
-            def __init__(self, app):
-                pass
 import tempfile
 import os
 from typing import List, Dict
-import pandas as pd
-import PyPDF2
-from docx import Document
+import importlib
 import io
-import google.generativeai as genai
+import re
+import secrets
+import logging
 import requests
-from msal import ConfidentialClientApplication
 import time
+import datetime
+from collections import Counter, OrderedDict
+from itertools import islice
+from functools import partial
 import os
 from dotenv import load_dotenv
 
+import session_store
+import telemetry
+import web_responses
+from telemetry import trace_span
+from content_cache import SharedContentCache, content_key
+from drive_items import DriveItem
+from model_router import ModelRouter, Route
+from prefetch import PRIORITY_FOLDER_FILE, PRIORITY_SELECTED, Prefetcher
+from singleflight import SingleFlight
+from token_cache import TokenManager
+
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'fallback-secret-key')
-app.config['SESSION_TYPE'] = 'filesystem'
+# Server-side sessions: 'sqlite' (one host, any number of workers), 'redis' (multi-node, with the
+# MSAL token cache in the same Redis) or 'cookie'
+app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'sqlite')
+app.config['SESSION_TTL'] = int(os.getenv('SESSION_TTL', 86400))
+app.config['SESSION_SQLITE_PATH'] = os.getenv('SESSION_SQLITE_PATH')
+app.config['SESSION_REDIS_URL'] = os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0')
 app.config['SESSION_PERMANENT'] = False
-Session(app)
+app.session_interface = session_store.create_session_interface(app.config, app.instance_path)
+telemetry.init_app(app)
+web_responses.init_app(app)
 
 # Azure AD Configuration
 CLIENT_ID = os.getenv('AZURE_CLIENT_ID')
@@ -49,90 +61,426 @@ SCOPES = [
 
 AUTHORITY = f"https://login.microsoftonline.com/{TENANT_ID}"
 
+# Shared MSAL client; tokens persist in SQLite so every worker can refresh them silently.
+# With Redis sessions they live in Redis too, so any host can rebuild a user's assistant
+TOKEN_CACHE_PATH = os.getenv('TOKEN_CACHE_PATH', os.path.join(app.instance_path, 'token_cache.sqlite3'))
+token_manager = TokenManager(CLIENT_ID, AUTHORITY, CLIENT_SECRET, SCOPES, TOKEN_CACHE_PATH,
+                             redis_url=app.config['SESSION_REDIS_URL']
+                             if app.config['SESSION_BACKEND'] == 'redis' else None)
+
+# Refresh access tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = 300
+
+# Microsoft Graph base URL (overridable to point at a mock server for benchmarks)
+GRAPH_API_BASE = os.getenv('GRAPH_API_BASE', 'https://graph.microsoft.com/v1.0').rstrip('/')
+
 # Gemini Configuration
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 
+# Extractor and LLM libraries are imported on first use so workers boot fast.
+# PRELOAD_HEAVY_MODULES=true imports them at startup instead; combined with
+# gunicorn --preload they are loaded once in the master and shared by workers.
+HEAVY_MODULES = ('google.generativeai', 'pandas', 'PyPDF2', 'docx')
+PRELOAD_HEAVY_MODULES = os.getenv('PRELOAD_HEAVY_MODULES', 'false').lower() in ('1', 'true', 'yes')
+
+def preload_heavy_modules():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+if PRELOAD_HEAVY_MODULES:
+    preload_heavy_modules()
+
+# Gemini model routing: small prompts and general questions use the fast model,
+# multi-file synthesis the standard one and very large contexts the heavy one
+GEMINI_FAST_MODEL = os.getenv('GEMINI_FAST_MODEL', 'gemini-2.5-flash-lite')
+GEMINI_STANDARD_MODEL = os.getenv('GEMINI_STANDARD_MODEL', 'gemini-2.5-flash')
+GEMINI_HEAVY_MODEL = os.getenv('GEMINI_HEAVY_MODEL', 'gemini-2.5-pro')
+MODEL_ROUTE_FAST_MAX_CHARS = int(os.getenv('MODEL_ROUTE_FAST_MAX_CHARS', 4000))
+MODEL_ROUTE_HEAVY_MIN_CHARS = int(os.getenv('MODEL_ROUTE_HEAVY_MIN_CHARS', 60000))
+# Seconds; a route slower than this on average sends work to a cheaper, faster route
+MODEL_ROUTE_LATENCY_BUDGET = float(os.getenv('MODEL_ROUTE_LATENCY_BUDGET', 20))
+
+def gemini_model(route):
+    import google.generativeai as genai
+    return genai.GenerativeModel(
+        route.model_name, generation_config=genai.GenerationConfig(max_output_tokens=route.max_output_tokens))
+
+model_router = ModelRouter(
+    [
+        Route('fast', GEMINI_FAST_MODEL, max_output_tokens=1024),
+        Route('standard', GEMINI_STANDARD_MODEL, max_output_tokens=4096),
+        Route('heavy', GEMINI_HEAVY_MODEL, max_output_tokens=8192),
+    ],
+    gemini_model,
+    fast_max_chars=MODEL_ROUTE_FAST_MAX_CHARS,
+    heavy_min_chars=MODEL_ROUTE_HEAVY_MIN_CHARS,
+    latency_budget=MODEL_ROUTE_LATENCY_BUDGET,
+)
+
+def children_endpoint(folder_path):
+    """Graph endpoint listing the children of a folder given by its '/a/b' path"""
+    if folder_path == "/":
+        return '/me/drive/root/children'
+    return f"/me/drive/root:/{folder_path.lstrip('/')}:/children"
+
+def item_endpoint(item_id, drive_id=None):
+    """Graph path of an item; shared items are only reachable through their own drive"""
+    return f"/drives/{drive_id}/items/{item_id}" if drive_id else f"/me/drive/items/{item_id}"
+
+# File types _extract_text reads; anything else is labelled 'other' in metrics
+EXTRACTED_FILE_TYPES = frozenset(('txt', 'pdf', 'docx', 'doc', 'csv', 'xlsx', 'xls'))
+
+def file_kind(file_type):
+    """Bound a file extension (client-supplied for selected items) to a fixed metric label"""
+    return file_type if file_type in EXTRACTED_FILE_TYPES else 'other'
+
+def graph_call_kind(endpoint):
+    """Bucket a Graph endpoint into a low-cardinality label for metrics"""
+    path = endpoint.split('?', 1)[0]
+    if 'search(' in path:
+        return 'search'
+    if path.endswith('/children'):
+        return 'children'
+    if path.endswith('/content'):
+        return 'content'
+    if '/items/' in path:
+        return 'item'
+    return path.strip('/').replace('/', '_') or 'root'
+
+# Drive discovery: only request the fields we use, in pages
+DRIVE_ITEM_SELECT = 'id,name,size,lastModifiedDateTime,webUrl,parentReference,file,folder,remoteItem'
+CHILDREN_PAGE_SIZE = 200
+SEARCH_PAGE_SIZE = 25
+# Search results examined per discovery query; type and date filters are applied client-side,
+# so an unmatched hint must not page through the whole drive
+SEARCH_MAX_SCANNED = 100
+# Files returned by the flat listing fallbacks (query_files, /debug)
+FLAT_LISTING_MAX_FILES = 1000
+
+SEARCH_STOPWORDS = frozenset('''
+a about all an and any are as at be by can could did do does file files find for from get give have how i in
+is it its list me my of on or please show summarize summary tell that the their them these this those to
+was were what when where which who why will with would you your document documents doc docs onedrive
+'''.split())
+
+# Words in a question that narrow discovery to file extensions
+SEARCH_TYPE_HINTS = {
+    'pdf': ('pdf',), 'pdfs': ('pdf',),
+    'word': ('docx', 'doc'), 'docx': ('docx',),
+    'excel': ('xlsx', 'xls', 'csv'), 'spreadsheet': ('xlsx', 'xls', 'csv'),
+    'spreadsheets': ('xlsx', 'xls', 'csv'), 'xlsx': ('xlsx',), 'csv': ('csv',),
+    'text': ('txt', 'md'), 'txt': ('txt',), 'markdown': ('md',),
+}
+
+# Phrases that narrow discovery to recently modified files, in days
+SEARCH_RECENCY_HINTS = (
+    ('today', 1), ('yesterday', 2), ('this week', 7), ('last week', 14),
+    ('this month', 31), ('last month', 62), ('recent', 30), ('latest', 30), ('this year', 366),
+)
+
+def parse_search_intent(question, max_keywords=5):
+    """Split a question into (keywords, extensions, modified_after) for Graph search"""
+    text = question.lower()
+    extensions = set()
+    modified_after = None
+    for phrase, days in SEARCH_RECENCY_HINTS:
+        if phrase in text:
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days)
+            modified_after = since.strftime('%Y-%m-%dT%H:%M:%SZ')
+            break
+    words = []
+    for word in ''.join(c if c.isalnum() else ' ' for c in text).split():
+        if word in SEARCH_TYPE_HINTS:
+            extensions.update(SEARCH_TYPE_HINTS[word])
+        elif len(word) > 2 and word not in SEARCH_STOPWORDS and not word.isdigit():
+            words.append(word)
+    recency_words = {w for phrase, _ in SEARCH_RECENCY_HINTS for w in phrase.split()}
+    keywords = [w for w, _ in Counter(w for w in words if w not in recency_words).most_common(max_keywords)]
+    return keywords, extensions, modified_after
+
+# Seconds a crawled directory tree is served before Graph is crawled again
+DIRECTORY_SNAPSHOT_TTL = int(os.getenv('DIRECTORY_SNAPSHOT_TTL', 60))
+
+# Extracted text shared across users, keyed by drive id, item id and cTag; MB of string memory (0 disables)
+SHARED_CONTENT_CACHE_MB = int(os.getenv('SHARED_CONTENT_CACHE_MB', 128))
+CONTENT_METADATA_SELECT = 'id,name,cTag,eTag,size,parentReference,@microsoft.graph.downloadUrl'
+shared_content = SharedContentCache(SHARED_CONTENT_CACHE_MB * 1024 * 1024)
+# Concurrent first reads of the same shared file version download and extract it once
+extraction_flight = SingleFlight('extraction')
+
+# Files read from each selected folder when answering (and when prefetching)
+FOLDER_SAMPLE_FILES = 5
+# Background download of items as they are selected in the file browser (0 workers disables)
+PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 2))
+PREFETCH_MAX_PENDING = int(os.getenv('PREFETCH_MAX_PENDING', 64))
+PREFETCH_MAX_ITEMS = 20  # selected items considered per notification
+prefetcher = Prefetcher(PREFETCH_WORKERS, PREFETCH_MAX_PENDING)
+
+# Conversation memory
+MAX_CONVERSATIONS_PER_USER = 8
+HISTORY_VERBATIM_TURNS = 2       # most recent turns kept in full in the history summary
+HISTORY_MAX_CHARS = 4000         # cap on the history summary sent with each turn
+HISTORY_MAX_TURNS = 20           # turns kept per conversation; HISTORY_MAX_CHARS is normally reached first
+# Opt-in cap on the context resent with a follow-up that has no Gemini context cache
+# (0, the default, resends the full context so detail questions keep the whole files)
+FOLLOWUP_CONTEXT_MAX_CHARS = int(os.getenv('FOLLOWUP_CONTEXT_MAX_CHARS', 0))
+# Gemini explicit context caching for follow-ups on a large, unchanged selection
+CONTEXT_CACHE_MIN_TOKENS = int(os.getenv('GEMINI_CONTEXT_CACHE_MIN_TOKENS', 1024))
+CONTEXT_CACHE_TTL = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', 900))
+
+def selection_key_for(selected_items):
+    """Order-independent identity of a selection, used to detect follow-up questions"""
+    return tuple(sorted(str(item.get('id')) for item in selected_items)) or ('*',)
+
+class Conversation:
+    """Chat history plus the packed file context for the conversation's current selection"""
+
+    def __init__(self, conversation_id):
+        self.id = conversation_id
+        self.selection_key = None
+        self.context = ''
+        self.candidate_files = None  # files discovered for an all-files context
+        self.history = []  # [(question, answer), ...]
+        self.cached_content = None
+        self.cached_model = None
+        self.cache_expires_at = 0
+        self.cache_failed = False
+
+    def has_context_for(self, selection_key):
+        return bool(self.context) and self.selection_key == selection_key
+
+    def set_context(self, selection_key, context, candidate_files=None):
+        """Adopt a new selection's packed context; history is kept across selections"""
+        self.release_cache()
+        self.selection_key = selection_key
+        self.context = context
+        self.candidate_files = candidate_files
+
+    def add_turn(self, question, answer):
+        self.history.append((question, answer))
+        del self.history[:-HISTORY_MAX_TURNS]
+
+    def context_excerpt(self, question, max_chars):
+        """The packed context cut to max_chars, shared among the files the question mentions (or all files)"""
+        if not max_chars or len(self.context) <= max_chars:
+            return self.context
+        preamble, *sections = re.split(r'(?m)^(?=--- )', self.context)
+        keywords = parse_search_intent(question)[0]
+        mentioned = [section for section in sections if any(k in section.lower() for k in keywords)]
+        chosen = mentioned or sections
+        share = max(0, max_chars - len(preamble)) // max(1, len(chosen))
+        return preamble + "".join(
+            section[:share].rstrip() + "\n...\n\n" if len(section) > share else section for section in chosen)
+
+    def history_summary(self):
+        """Recent turns verbatim, older turns compressed, bounded by HISTORY_MAX_CHARS"""
+        if not self.history:
+            return ''
+        lines = []
+        split = len(self.history) - HISTORY_VERBATIM_TURNS
+        for i, (question, answer) in enumerate(self.history):
+            if i < split:
+                lines.append(f"- Q: {question[:150]} | A: {' '.join(answer.split())[:200]}")
+            else:
+                lines.append(f"User: {question}\nAssistant: {answer[:1500]}")
+        summary = "\n".join(lines)
+        if len(summary) > HISTORY_MAX_CHARS:
+            summary = "..." + summary[-HISTORY_MAX_CHARS:]
+        return f"Conversation so far:\n{summary}\n\n"
+
+    def release_cache(self):
+        if self.cached_content is not None:
+            try:
+                self.cached_content.delete()
+            except Exception as e:
+                logger.debug(f"Could not delete context cache: {e}")
+        self.cached_content = None
+        self.cached_model = None
+        self.cache_expires_at = 0
+        self.cache_failed = False
+
+class DirectorySnapshot:
+    """A crawled directory tree with its JSON body (and ETag) and file browser HTML built once"""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.built_at = time.time()
+        with trace_span('serialize', kind='directory') as span:
+            self.body = web_responses.CachedBody(web_responses.dumps({
+                'success': True,
+                'directory': self.structure(),
+            }))
+            span.set(bytes=len(self.body.data))
+        self._html = None
+
+    def structure(self):
+        return [item.to_tree_dict() for item in self.tree]
+
+    def html(self):
+        if self._html is None:
+            self._html = render_directory(self.structure())
+        return self._html
+
+    def is_fresh(self):
+        return time.time() - self.built_at < DIRECTORY_SNAPSHOT_TTL
+
 class OneDriveGeminiAssistant:
-    def __init__(self, access_token):
-        self.access_token = access_token
+    def __init__(self, access_token, token_provider=None, expires_in=3600):
+        self._access_token = access_token
+        self._token_expires_at = time.time() + int(expires_in)
+        self.token_provider = token_provider  # callable(force_refresh=False) -> MSAL result or None
         self.genai = self.initialize_gemini()
         self.file_cache = {}  # Cache for downloaded file contents
         self.cache_max_size = 50  # Maximum number of files to cache
-        print(f"Assistant initialized with access token: {bool(access_token)}")
+        self.conversations = OrderedDict()  # conversation id -> Conversation, least recently used first
+        self.directory_snapshot = None
+        # Identical concurrent calls (double submits, several tabs) share one in-flight call
+        self._graph_flight = SingleFlight('graph')
+        self._download_flight = SingleFlight('download')
+        self._directory_flight = SingleFlight('directory')
+        logger.debug(f"Assistant initialized with access token: {bool(access_token)}")
+
+    @property
+    def access_token(self):
+        """Current access token, silently refreshed shortly before it expires"""
+        if self.token_provider and time.time() >= self._token_expires_at - TOKEN_REFRESH_MARGIN:
+            self.refresh_access_token()
+        return self._access_token
+
+    def refresh_access_token(self, force_refresh=False):
+        """Fetch a fresh token from the shared MSAL cache; returns True on success"""
+        if not self.token_provider:
+            return False
+        result = self.token_provider(force_refresh=force_refresh)
+        if not result:
+            logger.warning("Token refresh failed; user needs to sign in again")
+            return False
+        self.update_token(result)
+        return True
+
+    def update_token(self, token_result, token_provider=None):
+        """Adopt a new MSAL token result, e.g. after the user signs in again"""
+        self._access_token = token_result['access_token']
+        self._token_expires_at = time.time() + int(token_result.get('expires_in', 3600))
+        if token_provider:
+            self.token_provider = token_provider
+
+    def _graph_get(self, url, **kwargs):
+        """GET a Graph URL, retrying once with a refreshed token on 401"""
+        response = requests.get(url, headers={'Authorization': f'Bearer {self.access_token}'}, **kwargs)
+        if response.status_code == 401 and self.refresh_access_token(force_refresh=True):
+            response.close()
+            response = requests.get(url, headers={'Authorization': f'Bearer {self._access_token}'}, **kwargs)
+        return response
     
     def initialize_gemini(self):
-        """Initialize Gemini with correct configuration"""
+        """Configure Gemini; route models are built on first use rather than probed here"""
         try:
             if not GEMINI_API_KEY:
-                print("No Gemini API key found")
+                logger.debug("No Gemini API key found")
                 return None
                 
             # Configure Gemini
+            import google.generativeai as genai
             genai.configure(api_key=GEMINI_API_KEY)
-            
-            # Try different model names (updated for current API)
-            model_names_to_try = [
-                "gemini-2.5-flash",
-                "models/gemini-2.5-flash",
-                "models/gemini-2.5-pro"
-            ]
-            
-            successful_model = None
-            for model_name in model_names_to_try:
-                try:
-                    print(f"Trying model: {model_name}")
-                    model = genai.GenerativeModel(model_name)
-                    # Test with a simple prompt
-                    response = model.generate_content("Hello")
-                    if response and response.text:
-                        successful_model = model_name
-                        print(f"Successfully initialized: {model_name}")
-                        break
-                    else:
-                        print(f"Model {model_name} responded but with no text")
-                except Exception as e:
-                    print(f"Failed with {model_name}: {e}")
-                    continue
-            
-            if successful_model:
-                return genai.GenerativeModel(successful_model)
-            else:
-                print("All model attempts failed")
-                print("Check your API key at: https://aistudio.google.com/app/apikey")
-                return None
+            return model_router.default_model()
                 
         except Exception as e:
-            print(f"Gemini configuration error: {e}")
+            logger.warning(f"Gemini configuration error: {e}")
             return None
 
-    def make_graph_api_call(self, endpoint):
-        """Make Microsoft Graph API calls"""
+    def make_graph_api_call(self, endpoint, params=None):
+        """Make Microsoft Graph API calls (endpoint may also be an absolute @odata.nextLink)"""
         try:
-            headers = {
-                'Authorization': f'Bearer {self.access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            url = f"https://graph.microsoft.com/v1.0{endpoint}"
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                return response.json()
-            elif response.status_code == 403:
-                print(f"Permission denied for: {endpoint}")
-                return None
-            else:
-                print(f"API call failed ({response.status_code}): {endpoint}")
-                return None
-                
+            url = endpoint if endpoint.startswith('http') else f"{GRAPH_API_BASE}{endpoint}"
+            key = (url, tuple(sorted(params.items())) if params else ())
+            return self._graph_flight.do(key, self._fetch_graph_json, endpoint, url, params)
         except Exception as e:
-            print(f"API call error: {e}")
+            logger.warning(f"API call error: {e}")
+            return None
+
+    def _fetch_graph_json(self, endpoint, url, params):
+        with trace_span('graph', kind=graph_call_kind(endpoint)) as span:
+            response = self._graph_get(url, params=params)
+            span.set(bytes=len(response.content), status=response.status_code)
+        
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 403:
+            logger.warning(f"Permission denied for: {endpoint}")
+            return None
+        else:
+            logger.warning(f"API call failed ({response.status_code}): {endpoint}")
             return None
 
+    def iter_graph_items(self, endpoint, params=None):
+        """Yield items from a Graph collection, fetching further pages only as they are consumed"""
+        while endpoint:
+            data = self.make_graph_api_call(endpoint, params)
+            if not data:
+                return
+            yield from data.get('value', [])
+            # nextLink already carries the query parameters
+            endpoint, params = data.get('@odata.nextLink'), None
+
+    def list_children(self, endpoint):
+        """All children of a folder endpoint, projected to the fields we use"""
+        return list(self.iter_graph_items(endpoint, {'$select': DRIVE_ITEM_SELECT, '$top': CHILDREN_PAGE_SIZE}))
+
+    def search_files(self, keywords=(), extensions=None, modified_after=None, page_size=SEARCH_PAGE_SIZE,
+                     max_scanned=SEARCH_MAX_SCANNED):
+        """Lazily yield DriveItems for files matching keywords from Graph search, newest first.
+
+        Drive search does not accept $filter, so the type and modified-date
+        filters are applied to the projected pages as they stream in, over at
+        most max_scanned results (None for no limit). Without keywords the
+        extensions are searched for instead, since they are part of file names.
+        Searching the drive rather than its root also returns files shared with
+        the user, which are addressed through their own drive.
+        """
+        terms = keywords or sorted(extensions or ())
+        query = ' OR '.join(terms).replace("'", "''")
+        params = {
+            '$select': DRIVE_ITEM_SELECT,
+            '$top': page_size,
+            '$orderby': 'lastModifiedDateTime desc',
+        }
+        results = self.iter_graph_items(f"/me/drive/search(q='{query}')", params)
+        for raw in islice(results, max_scanned):
+            item = DriveItem.from_graph(raw)
+            # Newest first: once an item is older than the cutoff, so is everything after it
+            if modified_after and (item.last_modified or '') < modified_after:
+                return
+            if item.is_folder or (extensions and item.extension not in extensions):
+                continue
+            yield item
+
+    def discover_files(self, question, limit=10, fallback=True):
+        """Candidate files for a question: server-side keyword search first, full listing as fallback"""
+        keywords, extensions, modified_after = parse_search_intent(question)
+        if keywords or extensions or modified_after:
+            files = [f.to_file_dict() for f in islice(self.search_files(keywords, extensions, modified_after), limit)]
+            logger.debug(f"Search for {keywords} (types={extensions}, since={modified_after}) found {len(files)} files")
+            if files:
+                return files
+        if not fallback:
+            return []
+        if keywords:
+            # No keyword matched: newest files of the requested types and dates
+            files = [f.to_file_dict() for f in islice(self.search_files(extensions=extensions,
+                                                                        modified_after=modified_after), limit)]
+            if files:
+                return files
+        if extensions or modified_after:
+            # Nothing of the requested type or date among the results examined; don't list the drive
+            return []
+        # No hints at all: newest files
+        return self.get_all_files_flat(limit=limit)
+
     def test_connection(self):
         """Test if we can access OneDrive"""
         try:
-            print("Testing OneDrive connection...")
+            logger.debug("Testing OneDrive connection...")
             
             # Test 1: Can we get user info?
             user_info = self.make_graph_api_call('/me')
@@ -140,14 +488,14 @@ class OneDriveGeminiAssistant:
                 return "Cannot get user information"
             
             user_name = user_info.get('displayName', 'Unknown')
-            print(f"✅ User: {user_name}")
+            logger.debug(f"✅ User: {user_name}")
             
             # Test 2: Can we access OneDrive?
             drive_info = self.make_graph_api_call('/me/drive')
             if not drive_info:
                 return "Cannot access OneDrive - check Files.Read permissions"
             
-            print(f"OneDrive Type: {drive_info.get('driveType', 'Unknown')}")
+            logger.debug(f"OneDrive Type: {drive_info.get('driveType', 'Unknown')}")
             
             # Test 3: Can we list root items?
             root_items = self.make_graph_api_call('/me/drive/root/children')
@@ -155,315 +503,294 @@ class OneDriveGeminiAssistant:
                 return "Cannot list root items"
             
             items = root_items.get('value', [])
-            print(f"Found {len(items)} items in root directory")
+            logger.debug(f"Found {len(items)} items in root directory")
             
             return f"Connection successful! Found {len(items)} items in OneDrive root"
             
         except Exception as e:
             return f"Connection test error: {str(e)}"
 
-    def get_directory_structure(self, folder_path="/"):
-        """Get complete directory structure from OneDrive"""
+    def get_directory_tree(self, folder_path="/"):
+        """Directory tree below folder_path as DriveItems, folders carrying their children"""
         try:
-            print(f"Getting directory structure from: {folder_path}")
+            logger.debug(f"Getting directory structure from: {folder_path}")
             
-            if folder_path == "/":
-                endpoint = '/me/drive/root/children'
-            else:
-                # Remove leading slash for API call
-                folder_path_clean = folder_path.lstrip('/')
-                endpoint = f"/me/drive/root:/{folder_path_clean}:/children"
-            
-            items_data = self.make_graph_api_call(endpoint)
-            if not items_data:
-                print(f"No data returned for: {folder_path}")
+            items = self.list_children(children_endpoint(folder_path))
+            if not items:
+                logger.debug(f"No items returned for: {folder_path}")
                 return []
             
-            items = items_data.get('value', [])
-            print(f"Found {len(items)} items in {folder_path}")
+            logger.debug(f"Found {len(items)} items in {folder_path}")
             
-            structure = []
-            for item in items:
-                item_name = item.get('name', 'Unknown')
-                item_type = 'folder' if 'folder' in item else 'file'
-                
-                item_info = {
-                    'name': item_name,
-                    'type': item_type,
-                    'id': item.get('id'),
-                    'size': item.get('size', 0),
-                    'last_modified': item.get('lastModifiedDateTime'),
-                    'path': folder_path,
-                    'web_url': item.get('webUrl')
-                }
-                
+            tree = []
+            for raw in items:
+                item = DriveItem.from_graph(raw, folder_path)
                 # If it's a folder, get its contents recursively
-                if item_type == 'folder':
-                    subfolder_path = f"{folder_path.rstrip('/')}/{item_name}" if folder_path != "/" else f"/{item_name}"
-                    item_info['children'] = self.get_directory_structure(subfolder_path)
-                else:
-                    file_ext = item_name.lower().split('.')[-1] if '.' in item_name else 'unknown'
-                    item_info['extension'] = file_ext
-                
-                structure.append(item_info)
+                if item.is_folder:
+                    item.children = self.get_directory_tree(item.full_path)
+                tree.append(item)
             
-            return structure
+            return tree
             
         except Exception as e:
-            print(f"Error getting directory structure for {folder_path}: {e}")
+            logger.warning(f"Error getting directory structure for {folder_path}: {e}")
             return []
 
-    def get_all_files_flat(self):
-        """Get all files in a flat list recursively from all folders"""
+    def get_directory_snapshot(self, refresh=False):
+        """Root directory tree, crawled again once older than DIRECTORY_SNAPSHOT_TTL or when refresh is set"""
+        snapshot = None if refresh else self.directory_snapshot
+        if snapshot is None or not snapshot.is_fresh():
+            snapshot = self._directory_flight.do('/', self._build_directory_snapshot)
+        return snapshot
+
+    def _build_directory_snapshot(self):
+        snapshot = DirectorySnapshot(self.get_directory_tree())
+        # An empty tree is more likely a failed crawl than an empty drive: don't keep serving it
+        self.directory_snapshot = snapshot if snapshot.tree else None
+        return snapshot
+
+    def get_directory_structure(self, folder_path="/"):
+        """Get complete directory structure from OneDrive"""
+        return [item.to_tree_dict() for item in self.get_directory_tree(folder_path)]
+
+    def get_all_files_flat(self, limit=FLAT_LISTING_MAX_FILES):
+        """Get up to limit files in a flat list recursively from all folders, newest first when search works"""
         try:
-            print("Getting all files from OneDrive recursively...")
+            logger.debug("Getting all files from OneDrive recursively...")
             
             # Try different approaches to get files
             files = []
             
             # Method 1: Try search endpoint (most comprehensive)
             try:
-                print("Trying search endpoint...")
-                endpoint = "/me/drive/root/search(q='')"
-                search_data = self.make_graph_api_call(endpoint)
-                
-                if search_data and 'value' in search_data:
-                    items = search_data.get('value', [])
-                    print(f"Search found {len(items)} items")
-                    
-                    for item in items:
-                        if 'folder' not in item:  # It's a file
-                            item_name = item.get('name', 'Unknown')
-                            file_ext = item_name.lower().split('.')[-1] if '.' in item_name else 'unknown'
-                            
-                            file_data = {
-                                'name': item_name,
-                                'id': item.get('id'),
-                                'type': file_ext,
-                                'size': item.get('size', 0),
-                                'last_modified': item.get('lastModifiedDateTime'),
-                                'path': item.get('parentReference', {}).get('path', '/'),
-                                'web_url': item.get('webUrl')
-                            }
-                            files.append(file_data)
-                    
-                    if files:
-                        print(f"Search method found {len(files)} files")
-                        return files
-                else:
-                    print("Search endpoint returned no data")
+                logger.debug("Trying search endpoint...")
+                files = [f.to_file_dict() for f in islice(self.search_files(page_size=min(limit, CHILDREN_PAGE_SIZE),
+                                                                            max_scanned=None), limit)]
+                if files:
+                    logger.debug(f"Search method found {len(files)} files")
+                    return files
+                logger.warning("Search endpoint returned no files")
             except Exception as e:
-                print(f"Search method failed: {e}")
+                logger.warning(f"Search method failed: {e}")
             
             # Method 2: Recursive traversal of all folders
             try:
-                print("Trying recursive folder traversal...")
+                logger.debug("Trying recursive folder traversal...")
                 files = self.get_files_recursively("/")
                 if files:
-                    print(f"Recursive method found {len(files)} files")
-                    return files
+                    logger.debug(f"Recursive method found {len(files)} files")
+                    return files[:limit]
             except Exception as e:
-                print(f"Recursive method failed: {e}")
+                logger.warning(f"Recursive method failed: {e}")
             
             # Method 3: Try getting root children
             try:
-                print("Trying root children endpoint...")
-                endpoint = "/me/drive/root/children"
-                root_data = self.make_graph_api_call(endpoint)
+                logger.debug("Trying root children endpoint...")
+                items = self.list_children("/me/drive/root/children")
+                logger.debug(f"Root children found {len(items)} items")
                 
-                if root_data and 'value' in root_data:
-                    items = root_data.get('value', [])
-                    print(f"Root children found {len(items)} items")
-                    
-                    for item in items:
-                        if 'folder' not in item:  # It's a file
-                            item_name = item.get('name', 'Unknown')
-                            file_ext = item_name.lower().split('.')[-1] if '.' in item_name else 'unknown'
-                            
-                            file_data = {
-                                'name': item_name,
-                                'id': item.get('id'),
-                                'type': file_ext,
-                                'size': item.get('size', 0),
-                                'last_modified': item.get('lastModifiedDateTime'),
-                                'path': item.get('parentReference', {}).get('path', '/'),
-                                'web_url': item.get('webUrl')
-                            }
-                            files.append(file_data)
-                    
-                    if files:
-                        print(f"Root children method found {len(files)} files")
-                        return files
-                else:
-                    print("Root children endpoint returned no data")
+                files = [item.to_file_dict() for item in map(DriveItem.from_graph, items) if not item.is_folder]
+                
+                if files:
+                    logger.debug(f"Root children method found {len(files)} files")
+                    return files[:limit]
             except Exception as e:
-                print(f"Root children method failed: {e}")
+                logger.warning(f"Root children method failed: {e}")
             
             # Method 4: Try getting drive info first
             try:
-                print("Checking drive access...")
+                logger.debug("Checking drive access...")
                 drive_info = self.make_graph_api_call("/me/drive")
                 if drive_info:
-                    print(f"Drive access confirmed: {drive_info.get('driveType', 'Unknown')}")
+                    logger.debug(f"Drive access confirmed: {drive_info.get('driveType', 'Unknown')}")
                 else:
-                    print("Cannot access drive")
+                    logger.warning("Cannot access drive")
             except Exception as e:
-                print(f"Drive access failed: {e}")
+                logger.warning(f"Drive access failed: {e}")
             
-            print(f"No files found using any method")
+            logger.info("No files found using any method")
             return []
             
         except Exception as e:
-            print(f"Error getting all files: {e}")
+            logger.warning(f"Error getting all files: {e}")
             return []
 
     def get_files_recursively(self, folder_path="/", max_depth=5, current_depth=0):
         """Recursively get all files from folders"""
         try:
             if current_depth >= max_depth:
-                print(f"Max depth reached at {folder_path}")
+                logger.debug(f"Max depth reached at {folder_path}")
                 return []
             
-            print(f"Scanning folder: {folder_path} (depth: {current_depth})")
-            
-            if folder_path == "/":
-                endpoint = '/me/drive/root/children'
-            else:
-                folder_path_clean = folder_path.lstrip('/')
-                endpoint = f"/me/drive/root:/{folder_path_clean}:/children"
-            
-            items_data = self.make_graph_api_call(endpoint)
-            if not items_data:
-                return []
+            logger.debug(f"Scanning folder: {folder_path} (depth: {current_depth})")
             
-            items = items_data.get('value', [])
             files = []
-            
-            for item in items:
-                item_name = item.get('name', 'Unknown')
-                item_type = 'folder' if 'folder' in item else 'file'
-                
-                if item_type == 'file':
-                    file_ext = item_name.lower().split('.')[-1] if '.' in item_name else 'unknown'
-                    file_data = {
-                        'name': item_name,
-                        'id': item.get('id'),
-                        'type': file_ext,
-                        'size': item.get('size', 0),
-                        'last_modified': item.get('lastModifiedDateTime'),
-                        'path': folder_path,
-                        'web_url': item.get('webUrl')
-                    }
-                    files.append(file_data)
-                    print(f"Found file: {item_name}")
-                elif item_type == 'folder':
+            for raw in self.list_children(children_endpoint(folder_path)):
+                item = DriveItem.from_graph(raw, folder_path)
+                if item.is_folder:
                     # Recursively get files from subfolder
-                    subfolder_path = f"{folder_path.rstrip('/')}/{item_name}" if folder_path != "/" else f"/{item_name}"
-                    subfolder_files = self.get_files_recursively(subfolder_path, max_depth, current_depth + 1)
-                    files.extend(subfolder_files)
+                    files.extend(self.get_files_recursively(item.full_path, max_depth, current_depth + 1))
+                else:
+                    files.append(item.to_file_dict())
+                    logger.debug(f"Found file: {item.name}")
             
             return files
             
         except Exception as e:
-            print(f"Error scanning folder {folder_path}: {e}")
+            logger.warning(f"Error scanning folder {folder_path}: {e}")
             return []
 
-    def get_folder_files(self, folder_id):
+    def get_folder_files(self, folder_id, drive_id=None):
         """Get all files from a specific folder"""
         try:
-            endpoint = f"/me/drive/items/{folder_id}/children"
-            items_data = self.make_graph_api_call(endpoint)
-            
-            if not items_data:
-                return []
-            
-            files = []
-            for item in items_data.get('value', []):
-                if 'folder' not in item:
-                    item_name = item.get('name', 'Unknown')
-                    file_ext = item_name.lower().split('.')[-1] if '.' in item_name else 'unknown'
-                    
-                    file_data = {
-                        'name': item_name,
-                        'id': item.get('id'),
-                        'type': file_ext,
-                        'size': item.get('size', 0),
-                        'last_modified': item.get('lastModifiedDateTime'),
-                        'path': item.get('parentReference', {}).get('path', '/')
-                    }
-                    files.append(file_data)
+            endpoint = f"{item_endpoint(folder_id, drive_id)}/children"
+            files = [item.to_file_dict() for item in map(DriveItem.from_graph, self.list_children(endpoint))
+                     if not item.is_folder]
             
             return files
             
         except Exception as e:
-            print(f"Error getting folder files: {e}")
+            logger.warning(f"Error getting folder files: {e}")
             return []
 
-    def download_file_content(self, file_id, file_name, file_type):
+    def download_file_content(self, file_id, file_name, file_type, drive_id=None):
         """Download file content with caching"""
         try:
             # Check cache first
             cache_key = f"{file_id}_{file_name}"
             if cache_key in self.file_cache:
-                print(f"Using cached content for: {file_name}")
-                return self.file_cache[cache_key]
-            
-            print(f"Downloading: {file_name}")
-            
-            headers = {'Authorization': f'Bearer {self.access_token}'}
-            url = f"https://graph.microsoft.com/v1.0/me/drive/items/{file_id}/content"
+                logger.debug(f"Using cached content for: {file_name}")
+                with trace_span('download', kind=file_kind(file_type), cache_hit=True):
+                    return self.file_cache[cache_key]
             
-            # Use streaming for large files
-            response = requests.get(url, headers=headers, stream=True)
-            if response.status_code == 200:
-                # Read content in chunks for memory efficiency
-                content_bytes = b''
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        content_bytes += chunk
-                
-                processed_content = self.read_file_content(content_bytes, file_name, file_type)
+            return self._download_flight.do(cache_key, self._fetch_file_content,
+                                            file_id, file_name, file_type, cache_key, drive_id)
                 
-                # Cache the processed content
+        except Exception as e:
+            error_msg = f"Download error: {str(e)}"
+            logger.warning(error_msg)
+            return error_msg
+
+    def _fetch_file_content(self, file_id, file_name, file_type, cache_key, drive_id=None):
+        # Text another user already extracted from this file version, looked up only
+        # after this user's own metadata request proves they can read the item
+        metadata = self._content_metadata(file_id, drive_id)
+        shared_key = content_key(metadata) if metadata else None
+        if shared_key:
+            with trace_span('shared_content', kind=file_kind(file_type)) as span:
+                processed_content = shared_content.get(shared_key)
+                span.set(cache_hit=processed_content is not None)
+            if processed_content is not None:
+                logger.debug(f"Using shared content for: {file_name}")
                 self._add_to_cache(cache_key, processed_content)
-                
-                print(f"Downloaded and cached: {file_name}")
                 return processed_content
+            # Another user may be fetching this same version right now
+            processed_content = extraction_flight.do(
+                shared_key, self._download_and_extract, file_id, file_name, file_type, metadata, drive_id)
+        else:
+            processed_content = self._download_and_extract(file_id, file_name, file_type, metadata, drive_id)
+        
+        if processed_content.startswith("Download failed"):
+            return processed_content
+        
+        # Cache the processed content
+        self._add_to_cache(cache_key, processed_content)
+        if shared_key and not processed_content.startswith("Error"):
+            shared_content.put(shared_key, processed_content)
+        
+        logger.debug(f"Downloaded and cached: {file_name}")
+        return processed_content
+
+    def _download_and_extract(self, file_id, file_name, file_type, metadata=None, drive_id=None):
+        logger.debug(f"Downloading: {file_name}")
+        
+        url = f"{GRAPH_API_BASE}{item_endpoint(file_id, drive_id)}/content"
+        
+        download_url = metadata.get('@microsoft.graph.downloadUrl') if metadata else None
+        with trace_span('download', kind=file_kind(file_type), cache_hit=False) as span:
+            # Use streaming for large files
+            if download_url:
+                # Short-lived pre-authenticated URL: skips the /content redirect, no bearer token
+                response = requests.get(download_url, stream=True)
             else:
-                error_msg = f"Download failed: {response.status_code}"
-                print(f"{error_msg}")
-                return error_msg
-                
-        except Exception as e:
-            error_msg = f"Download error: {str(e)}"
-            print(f"{error_msg}")
+                response = self._graph_get(url, stream=True)
+            if response.status_code == 200:
+                # Collect chunks and join once instead of re-copying on every append
+                chunks = [chunk for chunk in response.iter_content(chunk_size=65536) if chunk]
+                content_bytes = b''.join(chunks)
+                span.set(bytes=len(content_bytes))
+        
+        if response.status_code != 200:
+            error_msg = f"Download failed: {response.status_code}"
+            logger.warning(error_msg)
             return error_msg
+        
+        return self.read_file_content(content_bytes, file_name, file_type)
     
+    def _content_metadata(self, file_id, drive_id=None):
+        """Version and download URL of a file, fetched with this user's token; None if sharing is off"""
+        if not shared_content.enabled:
+            return None
+        return self.make_graph_api_call(item_endpoint(file_id, drive_id), {'$select': CONTENT_METADATA_SELECT})
+
     def _add_to_cache(self, cache_key, content):
         """Add content to cache with LRU eviction"""
         # Remove oldest entries if cache is full
         if len(self.file_cache) >= self.cache_max_size:
-            # Remove the first (oldest) entry
+            # Remove the first (oldest) entry; prefetch workers may be evicting too
             oldest_key = next(iter(self.file_cache))
-            del self.file_cache[oldest_key]
-            print(f"Removed from cache: {oldest_key}")
+            self.file_cache.pop(oldest_key, None)
+            logger.debug(f"Removed from cache: {oldest_key}")
         
         self.file_cache[cache_key] = content
-        print(f"Cached: {cache_key}")
+        logger.debug(f"Cached: {cache_key}")
     
+    def prefetch_selection(self, selected_items):
+        """Queue background downloads for a selection; returns how many tasks were queued"""
+        queued = 0
+        for item in selected_items[:PREFETCH_MAX_ITEMS]:
+            if not item.get('id') or not item.get('name'):
+                continue
+            if item.get('type') == 'folder':
+                queued += prefetcher.submit((id(self), 'folder', item['id']), self._prefetch_folder,
+                                            item['id'], item.get('drive_id'))
+            elif item.get('type') == 'file':
+                queued += self._prefetch_file(item['id'], item['name'], item.get('extension', 'unknown'),
+                                              item.get('drive_id'), PRIORITY_SELECTED)
+        return queued
+
+    def _prefetch_file(self, file_id, file_name, file_type, drive_id, priority):
+        cache_key = f"{file_id}_{file_name}"
+        if cache_key in self.file_cache:
+            return False
+        return prefetcher.submit((id(self), cache_key), self.download_file_content,
+                                 file_id, file_name, file_type, drive_id, priority=priority)
+
+    def _prefetch_folder(self, folder_id, drive_id=None):
+        # Same sample of files that query_selected_items reads from a folder
+        for file_data in self.get_folder_files(folder_id, drive_id)[:FOLDER_SAMPLE_FILES]:
+            self._prefetch_file(file_data['id'], file_data['name'], file_data['type'], file_data['drive_id'],
+                                PRIORITY_FOLDER_FILE)
+
     def clear_cache(self):
         """Clear the file cache"""
         self.file_cache.clear()
-        print("File cache cleared")
+        self.directory_snapshot = None
+        logger.debug("File cache cleared")
 
     def read_file_content(self, content, file_name, file_type):
         """Read file content based on type"""
+        with trace_span('extract', kind=file_kind(file_type), bytes=len(content)):
+            return self._extract_text(content, file_name, file_type)
+
+    def _extract_text(self, content, file_name, file_type):
         try:
             if file_type == 'txt':
                 text_content = content.decode('utf-8', errors='ignore')[:10000]
                 return f"Text file: {file_name}\nContent:\n{text_content}"
                 
             elif file_type == 'pdf':
+                import PyPDF2
                 with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as f:
                     f.write(content)
                     f.flush()
@@ -477,16 +804,19 @@ class OneDriveGeminiAssistant:
                     return f"PDF file: {file_name}\nExtracted text:\n{text}"
                     
             elif file_type in ['docx', 'doc']:
+                from docx import Document
                 doc = Document(io.BytesIO(content))
                 text = "\n".join([p.text for p in doc.paragraphs[:50] if p.text.strip()])
                 return f"Word document: {file_name}\nContent:\n{text}"
                 
             elif file_type == 'csv':
+                import pandas as pd
                 df = pd.read_csv(io.BytesIO(content), nrows=20)
                 sample_data = df.head(3).to_string()
                 return f"CSV file: {file_name}\nRows: {len(df)}, Columns: {len(df.columns)}\nSample data:\n{sample_data}"
                 
             elif file_type in ['xlsx', 'xls']:
+                import pandas as pd
                 df = pd.read_excel(io.BytesIO(content), nrows=20)
                 sample_data = df.head(3).to_string()
                 return f"Excel file: {file_name}\nRows: {len(df)}, Columns: {len(df.columns)}\nSample data:\n{sample_data}"
@@ -497,51 +827,137 @@ class OneDriveGeminiAssistant:
         except Exception as e:
             return f"Error reading {file_name}: {str(e)}"
 
-    def query_selected_items(self, question, selected_items):
+    def _generate(self, prompt, kind, model=None):
+        """Send a prompt to Gemini, routed by kind and size unless a model is given, recording latency and token usage"""
+        with trace_span('gemini', kind=kind) as span:
+            if model is not None:
+                response = model.generate_content(prompt)
+            else:
+                response, route = model_router.generate(prompt, kind)
+                span.set(route=route.name)
+            usage = getattr(response, 'usage_metadata', None)
+            if usage:
+                span.set(prompt_tokens=getattr(usage, 'prompt_token_count', 0),
+                         completion_tokens=getattr(usage, 'candidates_token_count', 0))
+        return response.text
+
+    def get_conversation(self, conversation_id):
+        """Conversation state for an id, creating it and evicting the least recently used"""
+        if not conversation_id:
+            return None
+        conversation = self.conversations.pop(conversation_id, None) or Conversation(conversation_id)
+        self.conversations[conversation_id] = conversation
+        while len(self.conversations) > MAX_CONVERSATIONS_PER_USER:
+            _, evicted = self.conversations.popitem(last=False)
+            evicted.release_cache()
+        return conversation
+
+    def _context_cache_model(self, conversation):
+        """Model bound to a Gemini context cache of the conversation's files, if worthwhile"""
+        if conversation.cached_model is not None and time.time() < conversation.cache_expires_at:
+            return conversation.cached_model
+        conversation.release_cache()
+        if not GEMINI_API_KEY:
+            return None
+        import google.generativeai as genai
+        if not isinstance(self.genai, genai.GenerativeModel):
+            return None
+        if len(conversation.context) // 4 < CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        try:
+            with trace_span('context_cache', kind='create', bytes=len(conversation.context)):
+                cached = genai.caching.CachedContent.create(
+                    model=self.genai.model_name,
+                    display_name=f"onedrive-{conversation.id}"[:128],
+                    contents=[conversation.context],
+                    ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL),
+                )
+            conversation.cached_content = cached
+            conversation.cached_model = genai.GenerativeModel.from_cached_content(cached)
+            conversation.cache_expires_at = time.time() + CONTEXT_CACHE_TTL - 60
+            return conversation.cached_model
+        except Exception as e:
+            logger.warning(f"Context caching unavailable, resending context: {e}")
+            conversation.cache_failed = True
+            return None
+
+    def _follow_up(self, conversation, question):
+        """Answer a follow-up on an unchanged selection without re-reading any files"""
+        logger.debug(f"Follow-up in conversation {conversation.id}: {question}")
+        model = None if conversation.cache_failed else self._context_cache_model(conversation)
+        with trace_span('prompt_build', kind='followup') as span:
+            history = conversation.history_summary()
+            if model is not None:
+                # The files already live in the context cache; send only history and the question
+                prompt = f"""{history}Follow-up question: {question}
+
+Please answer using the files provided in the context and the conversation so far."""
+            else:
+                # No context cache: resend the packed files, cut down only if FOLLOWUP_CONTEXT_MAX_CHARS is set
+                prompt = f"""Based on these files/folders:
+
+{conversation.context_excerpt(question, FOLLOWUP_CONTEXT_MAX_CHARS)}
+
+{history}Follow-up question: {question}
+
+Please answer using the content above and the conversation so far."""
+            span.set(bytes=len(prompt), cache_hit=model is not None)
+        text = self._generate(prompt, kind='followup', model=model)
+        conversation.add_turn(question, text)
+        return text
+
+    def query_selected_items(self, question, selected_items, conversation_id=None):
         """Query specific selected files/folders"""
         try:
             if not self.genai:
                 return "Gemini AI is not available. Please check your API key."
             
-            print(f"Processing question for {len(selected_items)} selected items: {question}")
+            conversation = self.get_conversation(conversation_id)
+            selection_key = selection_key_for(selected_items)
+            if conversation and conversation.has_context_for(selection_key):
+                return self._follow_up(conversation, question)
+            
+            logger.debug(f"Processing question for {len(selected_items)} selected items: {question}")
             
             # Process all selected items
             all_contents = []
             total_items = len(selected_items)
             
             for i, item in enumerate(selected_items, 1):
-                print(f"Processing item {i}/{total_items}: {item['name']} (type: {item['type']})")
+                logger.debug(f"Processing item {i}/{total_items}: {item['name']} (type: {item['type']})")
                 
                 if item['type'] == 'file':
-                    content = self.download_file_content(item['id'], item['name'], item.get('extension', 'unknown'))
+                    content = self.download_file_content(item['id'], item['name'], item.get('extension', 'unknown'),
+                                                         item.get('drive_id'))
                     if content and not content.startswith("Error"):
                         all_contents.append({
                             'name': item['name'],
                             'type': 'file',
                             'content': content[:3000]
                         })
-                        print(f"Processed file: {item['name']}")
+                        logger.debug(f"Processed file: {item['name']}")
                     else:
-                        print(f"ould not process file: {item['name']}")
+                        logger.warning(f"Could not process file: {item['name']}")
                         
                 elif item['type'] == 'folder':
                     # Get all files from the folder recursively
-                    print(f"Processing folder: {item['name']}")
-                    folder_files = self.get_folder_files(item['id'])
+                    logger.debug(f"Processing folder: {item['name']}")
+                    folder_files = self.get_folder_files(item['id'], item.get('drive_id'))
                     folder_contents = []
                     
-                    # Process up to 5 files from the folder
-                    for j, file_data in enumerate(folder_files[:5], 1):
-                        print(f"Processing folder file {j}/5: {file_data['name']}")
-                        content = self.download_file_content(file_data['id'], file_data['name'], file_data['type'])
+                    # Process a sample of files from the folder
+                    for j, file_data in enumerate(folder_files[:FOLDER_SAMPLE_FILES], 1):
+                        logger.debug(f"Processing folder file {j}/{FOLDER_SAMPLE_FILES}: {file_data['name']}")
+                        content = self.download_file_content(file_data['id'], file_data['name'], file_data['type'],
+                                                             file_data['drive_id'])
                         if content and not content.startswith("Error"):
                             folder_contents.append({
                                 'name': file_data['name'],
                                 'content': content[:1500]
                             })
-                            print(f"Processed folder file: {file_data['name']}")
+                            logger.debug(f"Processed folder file: {file_data['name']}")
                         else:
-                            print(f"Could not process folder file: {file_data['name']}")
+                            logger.warning(f"Could not process folder file: {file_data['name']}")
                     
                     if folder_contents:
                         all_contents.append({
@@ -550,49 +966,55 @@ class OneDriveGeminiAssistant:
                             'content': f"Contains {len(folder_files)} files. Sample files:\n" + 
                                       "\n".join([f"- {fc['name']}: {fc['content']}" for fc in folder_contents])
                         })
-                        print(f"Processed folder: {item['name']} ({len(folder_files)} files, {len(folder_contents)} processed)")
+                        logger.debug(f"Processed folder: {item['name']} ({len(folder_files)} files, {len(folder_contents)} processed)")
                     else:
-                        print(f"No content could be read from folder: {item['name']}")
+                        logger.warning(f"No content could be read from folder: {item['name']}")
             
             if not all_contents:
                 return "No content could be read from the selected items. Please check if the files are accessible and try again."
             
-            print(f"Successfully processed {len(all_contents)} items for AI analysis")
+            logger.debug(f"Successfully processed {len(all_contents)} items for AI analysis")
             
             # Create context for Gemini
-            context = "Selected Items Content:\n\n"
-            for item_info in all_contents:
-                context += f"--- {item_info['name']} ---\n{item_info['content']}\n\n"
-            
-            prompt = f"""Based on these selected files/folders:
+            with trace_span('prompt_build', kind='selected') as span:
+                context = "Selected Items Content:\n\n" + "".join(
+                    f"--- {item_info['name']} ---\n{item_info['content']}\n\n" for item_info in all_contents)
+                history = conversation.history_summary() if conversation else ''
+                
+                prompt = f"""Based on these selected files/folders:
 
 {context}
 
-Question: {question}
+{history}Question: {question}
 
 Please provide a helpful answer focusing specifically on the selected content. If multiple items are selected, analyze them together and provide insights about their relationships or differences."""
+                span.set(bytes=len(prompt))
 
-            print("Sending to Gemini...")
-            response = self.genai.generate_content(prompt)
-            print("Got Gemini response")
+            logger.debug("Sending to Gemini...")
+            text = self._generate(prompt, kind='selected')
+            logger.debug("Got Gemini response")
             
-            return response.text
+            if conversation:
+                conversation.set_context(selection_key, context)
+                conversation.add_turn(question, text)
+            return text
             
         except Exception as e:
-            print(f"Error processing query: {e}")
+            logger.warning(f"Error processing query: {e}")
             return f"Error processing query: {str(e)}"
 
     def query_files(self, question):
         """Query all files (fallback method)"""
         try:
-            files = self.get_all_files_flat()[:5]  # Limit to 5 files
+            files = self.get_all_files_flat(limit=5)  # Limit to 5 files
             if not files:
                 return "No files found in your OneDrive."
             
             # Process files for Gemini
             file_contents = []
             for file_data in files:
-                content = self.download_file_content(file_data['id'], file_data['name'], file_data['type'])
+                content = self.download_file_content(file_data['id'], file_data['name'], file_data['type'],
+                                                     file_data.get('drive_id'))
                 if content and not content.startswith("Error"):
                     file_contents.append({
                         'name': file_data['name'],
@@ -602,95 +1024,115 @@ Please provide a helpful answer focusing specifically on the selected content. I
             if not file_contents:
                 return "Files were found but couldn't be read."
             
-            context = "OneDrive Files:\n\n"
-            for file_info in file_contents:
-                context += f"--- {file_info['name']} ---\n{file_info['content']}\n\n"
-            
-            prompt = f"""Based on these OneDrive files:
+            with trace_span('prompt_build', kind='files') as span:
+                context = "OneDrive Files:\n\n" + "".join(
+                    f"--- {file_info['name']} ---\n{file_info['content']}\n\n" for file_info in file_contents)
+                
+                prompt = f"""Based on these OneDrive files:
 
 {context}
 
 Question: {question}
 
 Please provide a helpful answer:"""
+                span.set(bytes=len(prompt))
             
-            response = self.genai.generate_content(prompt)
-            return response.text
+            return self._generate(prompt, kind='files')
             
         except Exception as e:
             return f"Error: {str(e)}"
 
-    def query_all_files(self, question):
+    def query_all_files(self, question, conversation_id=None):
         """Query ALL files in OneDrive when no specific files are selected"""
+        conversation = None
         try:
             if not self.genai:
                 return "Gemini AI is not available. Please check your API key."
             
-            print(f"Processing question with ALL OneDrive files: {question}")
+            logger.debug(f"Processing question with ALL OneDrive files: {question}")
+            conversation = self.get_conversation(conversation_id)
             
-            # Get all files from OneDrive
-            files = self.get_all_files_flat()[:10]  # Limit to 10 files for performance
+            previous_files = conversation.candidate_files if conversation and conversation.context else None
+            if previous_files:
+                # Follow-up: stay on the files already packed unless the new wording finds different ones
+                files = self.discover_files(question, limit=10, fallback=False) or previous_files
+            else:
+                # Search for files matching the question rather than listing the whole drive
+                files = self.discover_files(question, limit=10)  # Limit to 10 files for performance
             if not files:
                 # If no files found, provide a helpful response instead of error
-                print("No files found in OneDrive, providing general response")
-                return self.query_general_question(question)
+                logger.debug("No files found in OneDrive, providing general response")
+                return self.query_general_question(question, conversation)
             
-            print(f"Found {len(files)} files to process")
+            # Same candidate files as the previous turn: reuse the packed context
+            selection_key = selection_key_for(files)
+            if conversation and conversation.has_context_for(selection_key):
+                return self._follow_up(conversation, question)
+            
+            logger.debug(f"Found {len(files)} files to process")
             
             # Process files for Gemini
             file_contents = []
             for i, file_data in enumerate(files):
-                print(f"Processing file {i+1}/{len(files)}: {file_data['name']}")
-                content = self.download_file_content(file_data['id'], file_data['name'], file_data['type'])
+                logger.debug(f"Processing file {i+1}/{len(files)}: {file_data['name']}")
+                content = self.download_file_content(file_data['id'], file_data['name'], file_data['type'],
+                                                     file_data.get('drive_id'))
                 if content and not content.startswith("Error"):
                     file_contents.append({
                         'name': file_data['name'],
                         'type': file_data['type'],
                         'content': content[:2000]  # Limit content size
                     })
-                    print(f"Successfully processed: {file_data['name']}")
+                    logger.debug(f"Successfully processed: {file_data['name']}")
                 else:
-                    print(f"Could not process: {file_data['name']}")
+                    logger.warning(f"Could not process: {file_data['name']}")
             
             if not file_contents:
                 # If files found but couldn't be read, provide general response
-                print("Files found but couldn't be read, providing general response")
-                return self.query_general_question(question)
+                logger.debug("Files found but couldn't be read, providing general response")
+                return self.query_general_question(question, conversation)
             
-            print(f"Successfully processed {len(file_contents)} files for AI analysis")
+            logger.debug(f"Successfully processed {len(file_contents)} files for AI analysis")
             
             # Create context for Gemini
-            context = "All OneDrive Files Content:\n\n"
-            for file_info in file_contents:
-                context += f"--- {file_info['name']} ({file_info['type']}) ---\n{file_info['content']}\n\n"
-            
-            prompt = f"""Based on ALL the files in your OneDrive:
+            with trace_span('prompt_build', kind='all_files') as span:
+                context = "All OneDrive Files Content:\n\n" + "".join(
+                    f"--- {file_info['name']} ({file_info['type']}) ---\n{file_info['content']}\n\n"
+                    for file_info in file_contents)
+                history = conversation.history_summary() if conversation else ''
+                
+                prompt = f"""Based on ALL the files in your OneDrive:
 
 {context}
 
-Question: {question}
+{history}Question: {question}
 
 Please provide a comprehensive answer based on the content of all your OneDrive files. If the question is about specific information, search through all the files to find relevant details."""
+                span.set(bytes=len(prompt))
 
-            response = self.genai.generate_content(prompt)
-            return response.text
+            text = self._generate(prompt, kind='all_files')
+            if conversation:
+                conversation.set_context(selection_key, context, candidate_files=files)
+                conversation.add_turn(question, text)
+            return text
             
         except Exception as e:
-            print(f"Error processing all files: {e}")
+            logger.warning(f"Error processing all files: {e}")
             # Fallback to general question if there's an error
-            return self.query_general_question(question)
+            return self.query_general_question(question, conversation)
 
-    def query_general_question(self, question):
+    def query_general_question(self, question, conversation=None):
         """Answer general questions without file context"""
         try:
             if not self.genai:
                 return "Gemini AI is not available. Please check your API key."
             
-            print(f"🤖 Processing general question: {question}")
+            logger.debug(f"🤖 Processing general question: {question}")
+            history = conversation.history_summary() if conversation else ''
             
             prompt = f"""You are a helpful AI assistant. The user is asking a question, but either no files are available in their OneDrive or there was an issue accessing them. 
 
-Question: {question}
+{history}Question: {question}
 
 Please provide a helpful and informative answer. If the question seems to be about file management, OneDrive, or document analysis, you can provide general guidance on these topics. If it's a completely unrelated question, answer it as a helpful AI assistant would.
 
@@ -700,8 +1142,10 @@ Note: - If the user is asking about their files specifically, let them know that
       - Make important points
       """
       
-            response = self.genai.generate_content(prompt)
-            return response.text
+            text = self._generate(prompt, kind='general')
+            if conversation:
+                conversation.add_turn(question, text)
+            return text
             
         except Exception as e:
             return f" Error processing general question: {str(e)}"
@@ -709,8 +1153,38 @@ Note: - If the user is asking about their files specifically, let them know that
 # Store assistants in memory
 assistant_store = {}
 
+telemetry.REGISTRY.gauge('onedrive_assistants', 'Assistants held in this worker', lambda: len(assistant_store))
+telemetry.REGISTRY.gauge('onedrive_file_cache_entries', 'Cached file contents across all assistants',
+                         lambda: sum(len(a.file_cache) for a in list(assistant_store.values())))
+telemetry.REGISTRY.gauge('onedrive_shared_content_entries', 'File versions in the shared extraction cache',
+                         lambda: len(shared_content))
+telemetry.REGISTRY.gauge('onedrive_shared_content_bytes', 'Memory held by extracted text in the shared cache',
+                         lambda: shared_content.size)
+telemetry.REGISTRY.gauge('onedrive_prefetch_pending', 'Prefetch tasks queued or running', lambda: len(prefetcher))
+
 def get_user_key():
-    return session.get('email') or session.get('user', 'unknown')
+    """assistant_store key: the MSAL home account id, which unlike mail or display name is unique"""
+    return session.get('user_key') or session.get('account_id')
+
+def token_provider_for(account_id):
+    return partial(token_manager.acquire_token_silent, account_id) if account_id else None
+
+def create_assistant(account_id, token_result):
+    """Build an assistant whose Graph calls refresh tokens through the shared MSAL cache"""
+    return OneDriveGeminiAssistant(token_result['access_token'], token_provider=token_provider_for(account_id),
+                                   expires_in=token_result.get('expires_in', 3600))
+
+def get_assistant():
+    """Assistant for the current session, rebuilt from the token cache if this worker has none"""
+    user_key = get_user_key()
+    if user_key is None:
+        return None
+    assistant = assistant_store.get(user_key)
+    if assistant is None and session.get('account_id'):
+        result = token_manager.acquire_token_silent(session['account_id'])
+        if result:
+            assistant = assistant_store[user_key] = create_assistant(session['account_id'], result)
+    return assistant
 
 # Template filter for rendering directory structure
 @app.template_global()
@@ -743,7 +1217,8 @@ def render_directory(structure, level=0):
              id="{item['id']}" 
              data-name="{item['name']}" 
              data-type="{item['type']}"
-             data-extension="{item.get('extension', '')}">
+             data-extension="{item.get('extension', '')}"
+             data-drive-id="{item.get('drive_id') or ''}">
             <div class="file-checkbox">
                 <input type="checkbox">
                 <span class="checkmark"></span>
@@ -770,8 +1245,7 @@ def index():
 
 @app.route('/login')
 def login():
-    msal_app = ConfidentialClientApplication(CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET)
-    auth_url = msal_app.get_authorization_request_url(SCOPES, redirect_uri=REDIRECT_URI)
+    auth_url = token_manager.get_authorization_request_url(REDIRECT_URI)
     return redirect(auth_url)
 
 @app.route('/auth/callback')
@@ -781,23 +1255,27 @@ def auth_callback():
         if not code:
             return "No authorization code received"
         
-        msal_app = ConfidentialClientApplication(CLIENT_ID, authority=AUTHORITY, client_credential=CLIENT_SECRET)
-        result = msal_app.acquire_token_by_authorization_code(code, scopes=SCOPES, redirect_uri=REDIRECT_URI)
+        result = token_manager.acquire_token_by_authorization_code(code, REDIRECT_URI)
         
         if 'access_token' in result:
             headers = {'Authorization': f'Bearer {result["access_token"]}'}
-            user_data = requests.get('https://graph.microsoft.com/v1.0/me', headers=headers).json()
+            user_data = requests.get(f'{GRAPH_API_BASE}/me', headers=headers).json()
             
             session['user'] = user_data.get('displayName', 'User')
-            session['access_token'] = result['access_token']
             session['email'] = user_data.get('mail', '')
+            session['account_id'] = result.get('account_id')
+            # Without a resolved account, key this login on its own rather than on a shared name
+            session['user_key'] = result.get('account_id') or f"login.{secrets.token_hex(16)}"
             
-            print(f" User authenticated: {session['user']}")
+            logger.info(f"User authenticated: {session['user']}")
             
-            # Initialize assistant
-            assistant = OneDriveGeminiAssistant(result["access_token"])
+            # Initialize assistant (or keep the existing one and its warm caches on re-login)
             user_key = get_user_key()
-            assistant_store[user_key] = assistant
+            assistant = assistant_store.get(user_key)
+            if assistant is None:
+                assistant_store[user_key] = create_assistant(result.get('account_id'), result)
+            else:
+                assistant.update_token(result, token_provider_for(result.get('account_id')))
             
             return redirect(url_for('chat'))
         else:
@@ -811,22 +1289,20 @@ def chat():
     if 'user' not in session:
         return redirect(url_for('index'))
     
-    user_key = get_user_key()
-    assistant = assistant_store.get(user_key)
+    assistant = get_assistant()
     
-    # Get directory structure for the file browser
-    directory_structure = []
+    # Rendered file browser, reused until the directory snapshot expires
+    directory_html = ''
     if assistant:
-        directory_structure = assistant.get_directory_structure()
+        directory_html = assistant.get_directory_snapshot(refresh=bool(request.args.get('refresh'))).html()
     
     return render_template('chat.html', 
                          username=session['user'],
-                         directory_structure=directory_structure)
+                         directory_html=directory_html)
 
 @app.route('/api/chat', methods=['POST','GET'])
 def api_chat():
-    user_key = get_user_key()
-    assistant = assistant_store.get(user_key)
+    assistant = get_assistant()
     
     if not assistant:
         return jsonify({'error': 'Not authenticated'})
@@ -834,6 +1310,7 @@ def api_chat():
     data = request.json
     question = data.get('question', '')
     selected_items = data.get('selected_items', [])
+    conversation_id = data.get('conversation_id')
     
     if not question:
         return jsonify({'error': 'No question provided'})
@@ -841,13 +1318,14 @@ def api_chat():
     try:
         # If specific items are selected, query only those
         if selected_items and len(selected_items) > 0:
-            response = assistant.query_selected_items(question, selected_items)
+            response = assistant.query_selected_items(question, selected_items, conversation_id)
         else:
             # When no files are selected, access ALL files in OneDrive
-            response = assistant.query_all_files(question)
+            response = assistant.query_all_files(question, conversation_id)
             
         return jsonify({
             'response': response,
+            'conversation_id': conversation_id,
             'timestamp': time.time()
         })
     except Exception as e:
@@ -856,18 +1334,30 @@ def api_chat():
 @app.route('/api/directory')
 def api_directory():
     """API endpoint to get directory structure"""
-    user_key = get_user_key()
-    assistant = assistant_store.get(user_key)
+    assistant = get_assistant()
     
     if not assistant:
         return jsonify({'error': 'Not authenticated'})
     
     try:
-        directory_structure = assistant.get_directory_structure()
-        return jsonify({
-            'success': True,
-            'directory': directory_structure
-        })
+        # Unchanged trees revalidate to 304; otherwise the pre-serialized, pre-compressed body is sent.
+        # ?refresh=1 crawls OneDrive again instead of serving the snapshot
+        snapshot = assistant.get_directory_snapshot(refresh=bool(request.args.get('refresh')))
+        return web_responses.cached_response(snapshot.body)
+    except Exception as e:
+        return jsonify({'error': str(e)})
+
+@app.route('/api/selection', methods=['POST'])
+def api_selection():
+    """Selection changed in the file browser: start fetching its content in the background"""
+    assistant = get_assistant()
+    
+    if not assistant:
+        return jsonify({'error': 'Not authenticated'})
+    
+    selected_items = (request.get_json(silent=True) or {}).get('selected_items', [])
+    try:
+        return jsonify({'success': True, 'queued': assistant.prefetch_selection(selected_items)})
     except Exception as e:
         return jsonify({'error': str(e)})
 
@@ -877,8 +1367,7 @@ def debug():
     if 'user' not in session:
         return "Not authenticated"
     
-    user_key = get_user_key()
-    assistant = assistant_store.get(user_key)
+    assistant = get_assistant()
     
     if not assistant:
         return "No assistant"
@@ -918,6 +1407,7 @@ def test_gemini():
         if not GEMINI_API_KEY:
             return jsonify({'error': 'No Gemini API key found'})
         
+        import google.generativeai as genai
         genai.configure(api_key=GEMINI_API_KEY)
         model = genai.GenerativeModel('gemini-2.5-flash')
         response = model.generate_content("Hello, this is a test. Please respond with 'Gemini is working!'")
@@ -938,8 +1428,7 @@ def test_gemini():
 @app.route('/api/cache/clear', methods=['POST'])
 def clear_cache():
     """Clear file cache"""
-    user_key = get_user_key()
-    assistant = assistant_store.get(user_key)
+    assistant = get_assistant()
     
     if not assistant:
         return jsonify({'error': 'Not authenticated'})
@@ -956,8 +1445,7 @@ def clear_cache():
 @app.route('/api/cache/status')
 def cache_status():
     """Get cache status"""
-    user_key = get_user_key()
-    assistant = assistant_store.get(user_key)
+    assistant = get_assistant()
     
     if not assistant:
         return jsonify({'error': 'Not authenticated'})
@@ -977,15 +1465,22 @@ def cache_status():
     except Exception as e:
         return jsonify({'error': str(e)})
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker"""
+    return telemetry.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/logout')
 def logout():
     user_key = get_user_key()
     if user_key in assistant_store:
         del assistant_store[user_key]
+    token_manager.remove_account(session.get('account_id'))
     session.clear()
     return redirect(url_for('index'))
 
 if __name__ == '__main__':
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
     print(" Starting OneDrive + Gemini Flask App...")
     print(" Now with file/folder selection!")
     port = int(os.getenv('PORT', 5000))  
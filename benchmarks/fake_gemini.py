@@ -0,0 +1,43 @@
+"""Deterministic stand-in for ``google.generativeai.GenerativeModel``.
+
+Responses are derived from a hash of the prompt, token counts are estimated
+from prompt length, and an optional fixed plus per-token latency emulates the
+remote call so prompt-size regressions show up in end-to-end timings.
+"""
+import hashlib
+import time
+from types import SimpleNamespace
+
+CHARS_PER_TOKEN = 4
+
+
+class FakeResponse:
+    def __init__(self, text, prompt_tokens, completion_tokens):
+        self.text = text
+        self.usage_metadata = SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=completion_tokens,
+            total_token_count=prompt_tokens + completion_tokens,
+        )
+
+
+class FakeGenerativeModel:
+    def __init__(self, model_name='fake-gemini', latency_ms=0.0, ms_per_1k_tokens=0.0, **kwargs):
+        self.model_name = model_name
+        self.latency = latency_ms / 1000.0
+        self.seconds_per_token = ms_per_1k_tokens / 1000.0 / 1000.0
+        self.calls = 0
+        self.prompt_tokens = 0
+
+    def generate_content(self, contents, **kwargs):
+        prompt = contents if isinstance(contents, str) else repr(contents)
+        prompt_tokens = max(1, len(prompt) // CHARS_PER_TOKEN)
+        digest = hashlib.sha256(prompt.encode('utf-8', errors='ignore')).hexdigest()
+        text = f"[{self.model_name}] answer {digest[:12]} ({prompt_tokens} prompt tokens)"
+        completion_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        delay = self.latency + prompt_tokens * self.seconds_per_token
+        if delay:
+            time.sleep(delay)
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        return FakeResponse(text, prompt_tokens, completion_tokens)
@@ -0,0 +1,55 @@
+"""Stand-in for ``msal.ConfidentialClientApplication`` used by the load tests.
+
+The authorization URL points straight back at the redirect URI with a code,
+and the code exchange returns a ``mock-token-<code>`` access token that the
+mock Graph server maps to a distinct synthetic user. Accounts are recorded in
+the supplied token cache, so silent acquisition works from any worker that
+shares the cache, as it does with real MSAL.
+"""
+from urllib.parse import urlencode
+
+
+class FakeConfidentialClientApplication:
+    def __init__(self, client_id=None, authority=None, client_credential=None, token_cache=None, **kwargs):
+        self.client_id = client_id
+        self.token_cache = token_cache
+
+    def _accounts(self):
+        if self.token_cache is None:
+            return {}
+        return self.token_cache._cache.setdefault('Account', {})
+
+    def _token(self, name):
+        return {
+            'access_token': f'mock-token-{name}',
+            'token_type': 'Bearer',
+            'expires_in': 3600,
+            'id_token_claims': {'preferred_username': f'{name}@example.test'},
+        }
+
+    def get_authorization_request_url(self, scopes, redirect_uri=None, state=None, **kwargs):
+        params = {'code': 'anonymous'}
+        if state:
+            params['state'] = state
+        return f"{redirect_uri}?{urlencode(params)}"
+
+    def acquire_token_by_authorization_code(self, code, scopes, redirect_uri=None, **kwargs):
+        result = self._token(code)
+        username = result['id_token_claims']['preferred_username']
+        with self.token_cache._lock:
+            self._accounts()[f'mock.{code}'] = {'home_account_id': f'mock.{code}', 'username': username}
+            self.token_cache.has_state_changed = True
+        return dict(result, scope=' '.join(scopes))
+
+    def get_accounts(self, username=None):
+        with self.token_cache._lock:
+            accounts = list(self._accounts().values())
+        return [a for a in accounts if username is None or a['username'] == username]
+
+    def acquire_token_silent(self, scopes, account, force_refresh=False, **kwargs):
+        return self._token(account['home_account_id'][len('mock.'):])
+
+    def remove_account(self, account):
+        with self.token_cache._lock:
+            self._accounts().pop(account['home_account_id'], None)
+            self.token_cache.has_state_changed = True
@@ -0,0 +1,85 @@
+"""Shared helpers for the offline benchmarks: app bootstrapping and reporting."""
+import importlib
+import json
+import math
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(graph_base_url):
+    """Import ``app`` pointed at a mock Graph server with Gemini disabled.
+
+    Must run before anything else imports ``app``, because configuration is
+    read from the environment at import time.
+    """
+    os.environ['GRAPH_API_BASE'] = graph_base_url
+    # An empty key keeps initialize_gemini() from configuring the real SDK
+    os.environ['GEMINI_API_KEY'] = ''
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark-secret')
+    # Keep token and session databases out of the instance folder
+    state_dir = tempfile.mkdtemp(prefix='onedrive-bench-')
+    os.environ.setdefault('TOKEN_CACHE_PATH', os.path.join(state_dir, 'token_cache.sqlite3'))
+    os.environ.setdefault('SESSION_SQLITE_PATH', os.path.join(state_dir, 'sessions.sqlite3'))
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    return importlib.import_module('app')
+
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples:
+        return 0.0
+    rank = (len(sorted_samples) - 1) * pct / 100.0
+    low = math.floor(rank)
+    high = math.ceil(rank)
+    if low == high:
+        return sorted_samples[low]
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (rank - low)
+
+
+def summarize(name, samples, wall_seconds=None, **extra):
+    """Reduce latency samples (seconds) to throughput and percentiles in ms"""
+    ordered = sorted(samples)
+    total = wall_seconds if wall_seconds is not None else sum(ordered)
+    result = {
+        'scenario': name,
+        'ops': len(ordered),
+        'throughput_per_s': round(len(ordered) / total, 2) if total else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+    }
+    result.update(extra)
+    return result
+
+
+def format_table(results):
+    columns = ['scenario', 'ops', 'throughput_per_s', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms']
+    if results and 'scenario' not in results[0]:
+        columns = list(results[0])
+    extra = sorted({key for row in results for key in row} - set(columns))
+    columns += extra
+    widths = {col: max(len(col), *(len(str(row.get(col, ''))) for row in results)) for col in columns}
+    lines = ['  '.join(col.ljust(widths[col]) for col in columns)]
+    lines.append('  '.join('-' * widths[col] for col in columns))
+    for row in results:
+        lines.append('  '.join(str(row.get(col, '')).ljust(widths[col]) for col in columns))
+    return '\n'.join(lines)
+
+
+def compare_to_baseline(results, baseline_path, tolerance):
+    """Return scenarios whose p95 regressed by more than ``tolerance`` (0.2 = 20%)"""
+    with open(baseline_path) as f:
+        baseline = {row['scenario']: row for row in json.load(f)['results']}
+    regressions = []
+    for row in results:
+        before = baseline.get(row['scenario'])
+        if not before or not before.get('p95_ms'):
+            continue
+        ratio = row['p95_ms'] / before['p95_ms']
+        if ratio > 1 + tolerance:
+            regressions.append((row['scenario'], before['p95_ms'], row['p95_ms'], ratio))
+    return regressions
@@ -0,0 +1,91 @@
+"""Memory and serialization cost of the drive item model.
+
+Builds a flat index of N synthetic Graph items twice, once as the per-item
+dicts the listings used to build and once as ``DriveItem`` objects, and
+reports the traced allocation size and the time to convert each to the
+``/api/directory`` JSON shape:
+
+    python -m benchmarks.item_model --items 1000000
+"""
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+
+from benchmarks.harness import format_table
+from drive_items import DriveItem
+
+
+def graph_items(count, per_folder=50):
+    """Graph-like driveItem payloads spread over folders of ``per_folder`` files"""
+    for i in range(count):
+        folder = f'/Projects/Team {i // (per_folder * 20)}/Folder {i // per_folder}'
+        yield {
+            'id': f'01ABCDEFGHIJKLMN{i:018d}',
+            'name': f'report {i}.docx',
+            'size': 1024 + i,
+            'lastModifiedDateTime': f'2024-0{1 + i % 9}-1{i % 10}T12:00:00Z',
+            'webUrl': f'https://contoso-my.sharepoint.com/personal/u/Documents{folder}/report%20{i}.docx',
+        }, folder
+
+
+def build_dicts(count):
+    return [{
+        'name': item.get('name', 'Unknown'),
+        'type': 'file',
+        'id': item.get('id'),
+        'size': item.get('size', 0),
+        'last_modified': item.get('lastModifiedDateTime'),
+        # Paths used to be rebuilt by concatenation for every item
+        'path': folder,
+        'web_url': item.get('webUrl'),
+        'extension': item['name'].lower().split('.')[-1],
+    } for item, folder in graph_items(count)]
+
+
+def build_items(count):
+    return [DriveItem.from_graph(item, folder) for item, folder in graph_items(count)]
+
+
+def measure(name, build, to_json, count):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = build(count)
+    build_s = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    body = json.dumps(to_json(index))
+    serialize_s = time.perf_counter() - start
+    row = {
+        'model': name,
+        'items': count,
+        'memory_mb': round(size / 2 ** 20, 1),
+        'bytes_per_item': round(size / count),
+        'build_s': round(build_s, 3),
+        'serialize_s': round(serialize_s, 3),
+        'json_mb': round(len(body) / 2 ** 20, 1),
+    }
+    del index, body
+    return row
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=200000)
+    args = parser.parse_args(argv)
+
+    rows = [
+        measure('dict', build_dicts, lambda index: index, args.items),
+        measure('DriveItem', build_items, lambda index: [item.to_tree_dict() for item in index], args.items),
+    ]
+    print(format_table(rows))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""Concurrent-user load test against the app running under gunicorn.
+
+Starts the mock Graph server, launches ``benchmarks.serve`` (gunicorn with
+MSAL and Gemini stubbed) in a subprocess and drives N synthetic users at a
+fixed concurrency. Each user logs in, opens the chat page, loads the
+directory and then runs a mix of selection and all-files chat questions.
+
+    python -m benchmarks.loadtest --users 50 --concurrency 10 --actions 8
+    python -m benchmarks.loadtest --workers 4 --threads 4 --json load.json
+
+Reports requests/sec, per-endpoint latency percentiles, error rates and the
+RSS of each gunicorn worker (start, peak, end), which makes the growth of
+``assistant_store`` and the per-assistant ``file_cache`` visible.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.harness import REPO_ROOT, format_table, summarize
+from benchmarks.mock_graph import MockGraphServer, SyntheticDrive
+
+QUESTIONS = (
+    'Summarize these files',
+    'What are the key numbers in the budget?',
+    'List the action items from the meeting notes',
+    'Compare the quarterly reports',
+)
+
+
+def child_pids(pid):
+    pids = []
+    try:
+        for task in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{task}/children') as f:
+                pids.extend(int(p) for p in f.read().split())
+    except OSError:
+        pass
+    return pids
+
+
+def rss_kb(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler(threading.Thread):
+    """Samples the RSS of every gunicorn worker until stopped"""
+
+    def __init__(self, master_pid, interval=0.5):
+        super().__init__(name='rss-sampler', daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.first = {}
+        self.peak = {}
+        self.last = {}
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        for pid in child_pids(self.master_pid):
+            value = rss_kb(pid)
+            if not value:
+                continue
+            self.first.setdefault(pid, value)
+            self.peak[pid] = max(self.peak.get(pid, 0), value)
+            self.last[pid] = value
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.sample()
+
+    def report(self):
+        rows = []
+        for pid in sorted(self.first):
+            rows.append({
+                'pid': pid,
+                'start_mb': round(self.first[pid] / 1024, 1),
+                'peak_mb': round(self.peak[pid] / 1024, 1),
+                'end_mb': round(self.last[pid] / 1024, 1),
+                'growth_mb': round((self.last[pid] - self.first[pid]) / 1024, 1),
+            })
+        return rows
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_examples = {}
+        self._lock = threading.Lock()
+
+    def call(self, name, method, url, **kwargs):
+        start = time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = method(url, timeout=120, **kwargs)
+            if response.status_code >= 400:
+                error = f'HTTP {response.status_code}'
+            elif response.headers.get('Content-Type', '').startswith('application/json'):
+                body = response.json()
+                if isinstance(body, dict) and body.get('error'):
+                    error = str(body['error'])
+        except requests.RequestException as e:
+            error = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[name].append(elapsed)
+            if error:
+                self.errors[name] += 1
+                self.error_examples.setdefault(name, error)
+        return response if error is None else None
+
+
+def flatten_files(structure):
+    files = []
+    for item in structure:
+        if item.get('type') == 'folder':
+            files.extend(flatten_files(item.get('children', [])))
+        else:
+            files.append({'id': item['id'], 'name': item['name'], 'type': 'file',
+                          'extension': item.get('extension', '')})
+    return files
+
+
+def run_user(base_url, user_index, args, recorder):
+    rng = random.Random(args.seed + user_index)
+    http = requests.Session()
+    recorder.call('login', http.get, f'{base_url}/login', allow_redirects=False)
+    recorder.call('auth_callback', http.get, f'{base_url}/auth/callback',
+                  params={'code': f'user{user_index}'}, allow_redirects=False)
+    recorder.call('chat_page', http.get, f'{base_url}/chat')
+    response = recorder.call('api_directory', http.get, f'{base_url}/api/directory')
+    files = flatten_files(response.json().get('directory', [])) if response is not None else []
+
+    for _ in range(args.actions):
+        roll = rng.random()
+        if roll < args.directory_ratio:
+            recorder.call('api_directory', http.get, f'{base_url}/api/directory')
+        elif roll < args.directory_ratio + args.all_files_ratio or not files:
+            recorder.call('api_chat_all', http.post, f'{base_url}/api/chat',
+                          json={'question': rng.choice(QUESTIONS), 'selected_items': []})
+        else:
+            selection = rng.sample(files, min(len(files), rng.randint(1, args.max_selection)))
+            recorder.call('api_chat_selected', http.post, f'{base_url}/api/chat',
+                          json={'question': rng.choice(QUESTIONS), 'selected_items': selection})
+        if args.think_ms:
+            time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000.0)
+    if args.logout:
+        recorder.call('logout', http.get, f'{base_url}/logout', allow_redirects=False)
+
+
+def wait_for_server(base_url, process, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('app server exited during startup')
+        try:
+            requests.get(f'{base_url}/', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    raise RuntimeError('app server did not start in time')
+
+
+def scrape_gauges(base_url):
+    try:
+        text = requests.get(f'{base_url}/metrics', timeout=5).text
+    except requests.RequestException:
+        return {}
+    gauges = {}
+    for name in ('onedrive_assistants', 'onedrive_file_cache_entries', 'onedrive_shared_content_entries'):
+        match = re.search(rf'^{name} (\S+)$', text, re.M)
+        if match:
+            gauges[name] = float(match.group(1))
+    return gauges
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--actions', type=int, default=6, help='chat/directory actions per user session')
+    parser.add_argument('--max-selection', type=int, default=4)
+    parser.add_argument('--directory-ratio', type=float, default=0.2)
+    parser.add_argument('--all-files-ratio', type=float, default=0.2)
+    parser.add_argument('--logout', action='store_true',
+                        help='log users out at the end of their session (default keeps them, like real users)')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='mean pause between user actions')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--session-backend', default='sqlite', choices=('sqlite', 'cookie'))
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--fanout', type=int, default=3)
+    parser.add_argument('--files-per-folder', type=int, default=6)
+    parser.add_argument('--file-size', type=int, default=8192)
+    parser.add_argument('--latency-ms', type=float, default=10.0, help='mock Graph latency per request')
+    parser.add_argument('--gemini-latency-ms', type=float, default=50.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    drive = SyntheticDrive(args.depth, args.fanout, args.files_per_folder, args.file_size)
+    graph = MockGraphServer(drive, args.latency_ms).start()
+    base_url = f'http://127.0.0.1:{args.port}'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.serve', '--graph-url', graph.base_url,
+         '--bind', f'127.0.0.1:{args.port}', '--workers', str(args.workers),
+         '--threads', str(args.threads), '--gemini-latency-ms', str(args.gemini_latency_ms),
+         '--session-backend', args.session_backend],
+        cwd=REPO_ROOT)
+    try:
+        wait_for_server(base_url, server)
+        sampler = RssSampler(server.pid)
+        sampler.start()
+        recorder = Recorder()
+
+        wall_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_user, base_url, i, args, recorder) for i in range(args.users)]
+            for future in futures:
+                future.result()
+        wall = time.perf_counter() - wall_start
+
+        gauges = scrape_gauges(base_url)
+        sampler.stop()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+        graph.stop()
+
+    total_requests = sum(len(s) for s in recorder.samples.values())
+    total_errors = sum(recorder.errors.values())
+    results = []
+    for name, samples in recorder.samples.items():
+        results.append(summarize(name, samples, wall_seconds=wall, errors=recorder.errors.get(name, 0),
+                                 error_rate=round(recorder.errors.get(name, 0) / len(samples), 4)))
+    all_samples = [s for samples in recorder.samples.values() for s in samples]
+    results.append(summarize('ALL', all_samples, wall_seconds=wall, errors=total_errors,
+                             error_rate=round(total_errors / max(1, total_requests), 4)))
+
+    print(f"{args.users} users, concurrency {args.concurrency}, {args.workers} worker(s) x {args.threads} threads, "
+          f"{len(drive.items)} drive items")
+    print(format_table(results))
+    print()
+    print('Worker RSS (MB):')
+    print(format_table(sampler.report()) if sampler.report() else '  no workers sampled')
+    if gauges:
+        print(f"Gauges from one worker: {gauges}")
+    for name, example in recorder.error_examples.items():
+        print(f"First {name} error: {example}")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'wall_s': wall, 'results': results,
+                       'workers_rss': sampler.report(), 'gauges': gauges}, f, indent=2)
+    return 0 if total_errors == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
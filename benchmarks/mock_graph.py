@@ -0,0 +1,282 @@
+"""Local mock of the Microsoft Graph drive endpoints used by the assistant.
+
+Serves a deterministic synthetic drive whose shape (depth, fan-out, files per
+folder, file size) and per-request latency are configurable, so the Graph
+client code paths can be benchmarked without a tenant or network access.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlencode, urlsplit
+
+FILE_EXTENSIONS = ('txt', 'csv', 'md', 'txt', 'csv', 'bin')
+
+WORDS = ('budget', 'report', 'quarter', 'roadmap', 'invoice', 'meeting', 'design',
+         'sales', 'forecast', 'hiring', 'review', 'project', 'summary', 'notes')
+
+DRIVE_ID = 'b!mockdrive'
+DOWNLOAD_URL = '@microsoft.graph.downloadUrl'
+
+
+class SyntheticDrive:
+    """In-memory drive tree with stable ids, paths and file contents"""
+
+    def __init__(self, depth=3, fanout=4, files_per_folder=8, file_size=4096, seed=0):
+        self.depth = depth
+        self.fanout = fanout
+        self.files_per_folder = files_per_folder
+        self.file_size = file_size
+        self.seed = seed
+        self.items = {}      # id -> item dict (Graph shape, without children)
+        self.children = {}   # folder id -> [child ids]
+        self.by_path = {}    # '/a/b' -> folder id
+        self.root = self._add_folder('root', None, '', 0)
+        self.files = [item for item in self.items.values() if 'file' in item]
+
+    def _new_id(self, path):
+        digest = hashlib.sha1(f'{self.seed}:{path}'.encode()).hexdigest()[:16].upper()
+        return f'MOCK{digest}'
+
+    def _base_item(self, name, parent_id, parent_path, size):
+        path = f'{parent_path}/{name}' if name != 'root' else ''
+        item_id = self._new_id(path or '/')
+        item = {
+            'id': item_id,
+            'name': name,
+            'size': size,
+            'lastModifiedDateTime': f'2024-0{1 + len(path) % 9}-1{len(name) % 10}T12:00:00Z',
+            'webUrl': f'https://mock.sharepoint.test/Documents{path}',
+            'cTag': f'"c:{{{item_id}}},1"',
+            'eTag': f'"{{{item_id}}},1"',
+            'parentReference': {
+                'driveId': DRIVE_ID,
+                'id': parent_id,
+                'path': f'/drive/root:{parent_path}',
+            },
+            'createdBy': {'user': {'displayName': 'Mock User', 'email': 'mock@example.test'}},
+            'lastModifiedBy': {'user': {'displayName': 'Mock User', 'email': 'mock@example.test'}},
+        }
+        return path, item
+
+    def _add_folder(self, name, parent_id, parent_path, level):
+        path, item = self._base_item(name, parent_id, parent_path, 0)
+        child_ids = []
+        if level < self.depth:
+            for i in range(self.fanout):
+                child_ids.append(self._add_folder(f'Folder {level}-{i}', item['id'], path, level + 1))
+        for i in range(self.files_per_folder):
+            ext = FILE_EXTENSIONS[i % len(FILE_EXTENSIONS)]
+            word = WORDS[(i + level + len(path)) % len(WORDS)]
+            child_ids.append(self._add_file(f'{word} {level}-{i}.{ext}', item['id'], path))
+        item['folder'] = {'childCount': len(child_ids)}
+        item['size'] = sum(self.items[child]['size'] for child in child_ids)
+        self.items[item['id']] = item
+        self.children[item['id']] = child_ids
+        self.by_path[path or '/'] = item['id']
+        return item['id']
+
+    def _add_file(self, name, parent_id, parent_path):
+        _, item = self._base_item(name, parent_id, parent_path, self.file_size)
+        item['file'] = {'mimeType': 'text/plain'}
+        self.items[item['id']] = item
+        return item['id']
+
+    def content(self, item_id):
+        item = self.items[item_id]
+        name = item['name']
+        size = item['size']
+        if name.endswith('.csv'):
+            header = b'id,region,amount,owner\n'
+            rows = []
+            total = len(header)
+            n = 0
+            while total < size:
+                row = f'{n},{WORDS[n % len(WORDS)]},{(n * 37) % 1000},user{n % 7}\n'.encode()
+                rows.append(row)
+                total += len(row)
+                n += 1
+            return (header + b''.join(rows))[:max(size, len(header))]
+        line = f'{name}: ' + ' '.join(WORDS) + '\n'
+        data = line.encode() * (size // len(line) + 1)
+        return data[:size]
+
+    def search(self, query):
+        # Graph treats ``OR`` between terms as a keyword operator, not a search term
+        terms = [t.lower() for t in re.findall(r'\w+', query) if t != 'OR']
+        if not terms:
+            return list(self.items.values())
+        return [item for item in self.items.values()
+                if any(term in item['name'].lower() for term in terms)]
+
+
+def mock_user(access_token):
+    """Identity for a bearer token; ``mock-token-<name>`` maps to user ``<name>``"""
+    name = access_token[len('mock-token-'):] if access_token.startswith('mock-token-') else 'mock'
+    return {'displayName': f'Mock User {name}', 'mail': f'{name}@example.test', 'id': f'user-{name}'}
+
+
+def _select(query):
+    return [field for field in query.get('$select', [''])[0].split(',') if field]
+
+
+def _project(item, select):
+    if not select:
+        return dict(item)
+    return {key: item[key] for key in select if key in item}
+
+
+class GraphHandler(BaseHTTPRequestHandler):
+    server_version = 'MockGraph/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_content(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_page(self, items, query):
+        select = _select(query)
+        top = int(query.get('$top', ['0'])[0] or 0)
+        skip = int(query.get('$skiptoken', ['0'])[0] or 0)
+        orderby = query.get('$orderby', [''])[0].split()
+        if orderby:
+            items = sorted(items, key=lambda item: item.get(orderby[0]) or '',
+                           reverse=orderby[1:] == ['desc'])
+        page = items[skip:skip + top] if top else items[skip:]
+        payload = {'value': [_project(item, select) for item in page]}
+        if top and skip + top < len(items):
+            parts = urlsplit(self.path)
+            params = {k: v[0] for k, v in query.items() if k != '$skiptoken'}
+            params['$skiptoken'] = skip + top
+            host = self.headers.get('Host')
+            payload['@odata.nextLink'] = f'http://{host}{parts.path}?{urlencode(params)}'
+        self._send_json(payload)
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        query = parse_qs(parts.query)
+        drive = server.drive
+
+        # Pre-authenticated @microsoft.graph.downloadUrl targets need no bearer token
+        match = re.fullmatch(r'/download/([^/]+)', path)
+        if match and match.group(1) in drive.items:
+            return self._send_content(drive.content(match.group(1)))
+
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self._send_json({'error': {'code': 'InvalidAuthenticationToken'}}, 401)
+        prefix = '/v1.0'
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+
+        if path == '/me':
+            return self._send_json(mock_user(self.headers['Authorization'][len('Bearer '):]))
+        if path == '/me/drive':
+            return self._send_json({'id': DRIVE_ID, 'driveType': 'business'})
+        if path == '/me/drive/root':
+            return self._send_json(_project(drive.items[drive.root], _select(query)))
+        if path == '/me/drive/root/children':
+            return self._send_page([drive.items[c] for c in drive.children[drive.root]], query)
+
+        match = re.fullmatch(r"/me/drive(?:/root)?/search\(q='(.*)'\)", path)
+        if match:
+            return self._send_page(drive.search(match.group(1)), query)
+
+        match = re.fullmatch(r'/me/drive/root:(/.*):/children', path)
+        if match:
+            folder_id = drive.by_path.get(match.group(1).rstrip('/'))
+            if folder_id is None:
+                return self._send_json({'error': {'code': 'itemNotFound'}}, 404)
+            return self._send_page([drive.items[c] for c in drive.children[folder_id]], query)
+
+        match = re.fullmatch(r'/(?:me/drive|drives/([^/]+))/items/([^/]+)(/children|/content)?', path)
+        if match:
+            drive_id, item_id, tail = match.groups()
+            if drive_id not in (None, DRIVE_ID) or item_id not in drive.items:
+                return self._send_json({'error': {'code': 'itemNotFound'}}, 404)
+            if tail == '/children':
+                return self._send_page([drive.items[c] for c in drive.children.get(item_id, [])], query)
+            if tail == '/content':
+                # Like Graph, redirect to the pre-authenticated download URL
+                self.send_response(302)
+                self.send_header('Location', f"http://{self.headers.get('Host')}/download/{item_id}")
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            select = _select(query)
+            payload = _project(drive.items[item_id], select)
+            if DOWNLOAD_URL in select and 'file' in drive.items[item_id]:
+                payload[DOWNLOAD_URL] = f"http://{self.headers.get('Host')}/download/{item_id}"
+            return self._send_json(payload)
+
+        return self._send_json({'error': {'code': 'notFound', 'path': path}}, 404)
+
+
+class MockGraphServer(ThreadingHTTPServer):
+    """Threaded HTTP server exposing a ``SyntheticDrive`` under ``/v1.0``"""
+
+    daemon_threads = True
+
+    def __init__(self, drive, latency_ms=0.0, host='127.0.0.1', port=0):
+        super().__init__((host, port), GraphHandler)
+        self.drive = drive
+        self.latency = latency_ms / 1000.0
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1.0'
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='mock-graph', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve a synthetic OneDrive over a mock Graph API')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--depth', type=int, default=3)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--files-per-folder', type=int, default=8)
+    parser.add_argument('--file-size', type=int, default=4096)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    drive = SyntheticDrive(args.depth, args.fanout, args.files_per_folder, args.file_size)
+    server = MockGraphServer(drive, args.latency_ms, port=args.port)
+    print(f"Mock Graph serving {len(drive.items)} items at {server.base_url}")
+    server.serve_forever()
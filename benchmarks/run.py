@@ -0,0 +1,239 @@
+"""Offline end-to-end latency benchmarks.
+
+Starts a mock Graph server over a synthetic drive, points the app at it,
+swaps Gemini for a deterministic fake and times the main code paths:
+
+    python -m benchmarks.run --depth 3 --fanout 4 --latency-ms 20
+    python -m benchmarks.run --json out.json
+    python -m benchmarks.run --baseline out.json --tolerance 0.2
+
+With ``--baseline`` the run exits non-zero when any scenario's p95 latency
+regressed by more than the tolerance.
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fake_gemini import FakeGenerativeModel
+from benchmarks.harness import compare_to_baseline, format_table, load_app, summarize
+from benchmarks.mock_graph import MockGraphServer, SyntheticDrive
+
+BENCH_ACCOUNT_ID = 'bench.account'
+
+
+def install_fake_model(app_module, args):
+    """Serve every model route with one fake model so token usage is counted in one place"""
+    model = FakeGenerativeModel(latency_ms=args.gemini_latency_ms, ms_per_1k_tokens=args.gemini_ms_per_1k_tokens)
+    app_module.model_router.use_factory(lambda route: model)
+    return model
+
+
+def make_assistant(app_module, model):
+    assistant = app_module.OneDriveGeminiAssistant('benchmark-token')
+    assistant.genai = model
+    return assistant
+
+
+def login_client(app_module, assistant):
+    client = app_module.app.test_client()
+    with client.session_transaction() as sess:
+        sess['user'] = 'Bench User'
+        sess['account_id'] = BENCH_ACCOUNT_ID
+    app_module.assistant_store[BENCH_ACCOUNT_ID] = assistant
+    return client
+
+
+def file_selection(drive, count):
+    """Pick ``count`` files spread across the drive in the /api/chat item shape"""
+    files = drive.files
+    step = max(1, len(files) // max(1, count))
+    selection = []
+    for item in files[::step][:count]:
+        ext = item['name'].rsplit('.', 1)[-1]
+        selection.append({'id': item['id'], 'name': item['name'], 'type': 'file', 'extension': ext})
+    return selection
+
+
+def folder_selection(drive):
+    folder_id = next(c for c in drive.children[drive.root] if 'folder' in drive.items[c])
+    return {'id': folder_id, 'name': drive.items[folder_id]['name'], 'type': 'folder', 'extension': ''}
+
+
+def run_scenario(name, server, iterations, operation, setup=None, model=None):
+    samples = []
+    requests_before = server.request_count
+    tokens_before = model.prompt_tokens if model else 0
+    wall_start = time.perf_counter()
+    for i in range(iterations):
+        if setup:
+            setup(i)
+        start = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - start)
+    wall = time.perf_counter() - wall_start
+    graph_calls = (server.request_count - requests_before) / max(1, iterations)
+    prompt_tokens = ((model.prompt_tokens if model else 0) - tokens_before) / max(1, iterations)
+    return summarize(name, samples, wall_seconds=sum(samples), graph_calls_per_op=round(graph_calls, 1),
+                     prompt_tokens_per_op=round(prompt_tokens), wall_s=round(wall, 3))
+
+
+class Scenarios(dict):
+    """Scenario name -> (operation, setup), plus the fake model for token accounting"""
+
+    def __init__(self, model, scenarios):
+        super().__init__(scenarios)
+        self.model = model
+
+
+def build_scenarios(app_module, server, args):
+    drive = server.drive
+    model = install_fake_model(app_module, args)
+    assistant = make_assistant(app_module, model)
+    client = login_client(app_module, assistant)
+    files = drive.files
+    selected = file_selection(drive, args.selected_files)
+    folder = folder_selection(drive)
+
+    # A colleague reading the same files with their own assistant
+    colleague = make_assistant(app_module, model)
+
+    def download(i, reader=assistant):
+        item = files[i % len(files)]
+        reader.download_file_content(item['id'], item['name'], item['name'].rsplit('.', 1)[-1])
+
+    def download_first(i):
+        download(0)
+
+    def download_concurrently(i):
+        # A double submit / several tabs: identical cold reads of the same file at once
+        with ThreadPoolExecutor(max_workers=args.concurrent_callers) as pool:
+            list(pool.map(lambda _: download(i), range(args.concurrent_callers)))
+
+    def prime_first(i):
+        if i == 0:
+            download(0)
+
+    def chat(payload):
+        def operation(i):
+            response = client.post('/api/chat', json=payload)
+            body = response.get_json()
+            if not body or 'error' in body:
+                raise RuntimeError(f"/api/chat failed: {body}")
+        return operation
+
+    def clear_cache(i):
+        assistant.clear_cache()
+        app_module.shared_content.clear()
+
+    def shared_by_colleague(i):
+        colleague.clear_cache()
+        download(i, reader=colleague)
+
+    def api_directory(i, headers=None):
+        response = client.get('/api/directory', headers=headers)
+        if response.status_code not in (200, 304):
+            raise RuntimeError(f"/api/directory returned {response.status_code}")
+        return response
+
+    def prefetch_selection(i):
+        # Cold caches, then the selection notify and the time spent typing the question
+        clear_cache(i)
+        response = client.post('/api/selection', json={'selected_items': selected + [folder]})
+        if 'error' in response.get_json():
+            raise RuntimeError(f"/api/selection failed: {response.get_json()}")
+        app_module.prefetcher.join()
+
+    def drop_snapshot(i):
+        assistant.directory_snapshot = None
+
+    def prime_snapshot(i):
+        if i == 0:
+            etag.append(api_directory(i).headers['ETag'])
+
+    etag = []
+
+    return Scenarios(model, {
+        'directory_structure': (lambda i: assistant.get_directory_structure(), None),
+        'all_files_flat': (lambda i: assistant.get_all_files_flat(), None),
+        'download_cold': (download, clear_cache),
+        'download_warm': (download_first, prime_first),
+        # Per-user cache empty, but the colleague already extracted this file version
+        'download_shared': (download, shared_by_colleague),
+        'download_concurrent': (download_concurrently, clear_cache),
+        'api_directory': (api_directory, drop_snapshot),
+        'api_directory_gzip': (lambda i: api_directory(i, {'Accept-Encoding': 'gzip'}), prime_snapshot),
+        'api_directory_304': (lambda i: api_directory(i, {'If-None-Match': etag[0]}), prime_snapshot),
+        'api_chat_selected_cold': (chat({'question': 'Summarize the budget', 'selected_items': selected + [folder]}),
+                                   clear_cache),
+        'api_chat_selected_prefetched': (chat({'question': 'Summarize the budget',
+                                               'selected_items': selected + [folder]}), prefetch_selection),
+        'api_chat_selected_warm': (chat({'question': 'Summarize the budget', 'selected_items': selected + [folder]}),
+                                   None),
+        'api_chat_all_files': (chat({'question': 'What are the quarterly sales numbers?', 'selected_items': []}),
+                               None),
+        # First iteration packs the context; the rest are follow-ups in the same conversation
+        'api_chat_followup': (chat({'question': 'And what changed since last quarter?',
+                                    'selected_items': selected + [folder], 'conversation_id': 'bench'}), None),
+    })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--depth', type=int, default=3, help='folder nesting depth')
+    parser.add_argument('--fanout', type=int, default=3, help='subfolders per folder')
+    parser.add_argument('--files-per-folder', type=int, default=6)
+    parser.add_argument('--file-size', type=int, default=8192, help='bytes per synthetic file')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='mock Graph latency per request')
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0)
+    parser.add_argument('--gemini-ms-per-1k-tokens', type=float, default=0.0)
+    parser.add_argument('--selected-files', type=int, default=3)
+    parser.add_argument('--concurrent-callers', type=int, default=8, help='threads in download_concurrent')
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--scenario', action='append', help='run only these scenarios (repeatable)')
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    parser.add_argument('--baseline', help='compare p95 latencies against a previous --json file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 regression ratio')
+    args = parser.parse_args(argv)
+
+    drive = SyntheticDrive(args.depth, args.fanout, args.files_per_folder, args.file_size)
+    server = MockGraphServer(drive, args.latency_ms).start()
+    try:
+        app_module = load_app(server.base_url)
+        # Steady-state timings: keep one-off extractor imports out of the first samples
+        # (benchmarks.startup measures the cold path)
+        app_module.preload_heavy_modules()
+        scenarios = build_scenarios(app_module, server, args)
+        names = args.scenario or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+        print(f"Synthetic drive: {len(drive.items)} items ({len(drive.files)} files), "
+              f"Graph latency {args.latency_ms}ms")
+        results = []
+        for name in names:
+            operation, setup = scenarios[name]
+            results.append(run_scenario(name, server, args.iterations, operation, setup, scenarios.model))
+            print(f"  {name}: p50 {results[-1]['p50_ms']}ms", file=sys.stderr)
+    finally:
+        server.stop()
+
+    print(format_table(results))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.tolerance)
+        for scenario, before, after, ratio in regressions:
+            print(f"REGRESSION {scenario}: p95 {before}ms -> {after}ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
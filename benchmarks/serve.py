@@ -0,0 +1,64 @@
+"""Run the Flask app under gunicorn with Graph, MSAL and Gemini stubbed.
+
+Used by ``benchmarks.loadtest`` but also handy on its own:
+
+    python -m benchmarks.serve --graph-url http://127.0.0.1:8765/v1.0 --workers 2
+"""
+import argparse
+import os
+
+from gunicorn.app.base import BaseApplication
+
+from benchmarks.fake_gemini import FakeGenerativeModel
+from benchmarks.fake_msal import FakeConfidentialClientApplication
+from benchmarks.harness import load_app
+
+
+def install_stubs(app_module, gemini_latency_ms=0.0):
+    """Patch MSAL and Gemini on an imported ``app`` module"""
+    app_module.token_manager.app_factory = FakeConfidentialClientApplication
+    app_module.model_router.use_factory(
+        lambda route: FakeGenerativeModel(route.model_name, latency_ms=gemini_latency_ms))
+    app_module.OneDriveGeminiAssistant.initialize_gemini = lambda self: app_module.model_router.default_model()
+
+
+class StubbedApplication(BaseApplication):
+    def __init__(self, wsgi_app, options):
+        self.wsgi_app = wsgi_app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.wsgi_app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--graph-url', required=True)
+    parser.add_argument('--bind', default='127.0.0.1:5055')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--gemini-latency-ms', type=float, default=0.0)
+    parser.add_argument('--session-backend', default='sqlite', choices=('sqlite', 'cookie'))
+    args = parser.parse_args(argv)
+
+    os.environ['SESSION_BACKEND'] = args.session_backend
+    # Stubs are installed in the master so every forked worker inherits them
+    app_module = load_app(args.graph_url)
+    install_stubs(app_module, args.gemini_latency_ms)
+    StubbedApplication(app_module.app, {
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'accesslog': None,
+        'loglevel': 'warning',
+    }).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Worker startup cost: import time, first request latency and RSS.
+
+Each sample runs in a fresh interpreter, so nothing is warm. Measures
+``import app`` and the first request served through Flask's test client,
+both with the default lazy imports and with ``PRELOAD_HEAVY_MODULES``:
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --gunicorn     # also time gunicorn boot to first response
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import requests
+
+from benchmarks.harness import REPO_ROOT, format_table, percentile
+from benchmarks.loadtest import wait_for_server
+from benchmarks.mock_graph import MockGraphServer, SyntheticDrive
+
+CHILD = r'''
+import json, time, warnings
+warnings.simplefilter('ignore')
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/')
+served = time.perf_counter()
+with open('/proc/self/status') as f:
+    rss = next((int(line.split()[1]) for line in f if line.startswith('VmRSS:')), 0)
+print(json.dumps({'import_s': imported - start, 'first_request_s': served - imported,
+                  'status': response.status_code, 'rss_kb': rss}))
+'''
+
+
+def median(values):
+    return percentile(sorted(values), 50)
+
+
+def child_env(preload):
+    env = dict(os.environ, GEMINI_API_KEY='', PRELOAD_HEAVY_MODULES='true' if preload else 'false')
+    env.setdefault('TOKEN_CACHE_PATH', os.path.join('/tmp', 'startup-bench-token-cache.sqlite3'))
+    env.setdefault('SESSION_SQLITE_PATH', os.path.join('/tmp', 'startup-bench-sessions.sqlite3'))
+    return env
+
+
+def measure_import(preload, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=REPO_ROOT, env=child_env(preload),
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_s'] = time.perf_counter() - start
+        samples.append(result)
+    return {
+        'mode': 'preload' if preload else 'lazy',
+        'runs': runs,
+        'import_ms': round(median([s['import_s'] for s in samples]) * 1000, 1),
+        'first_request_ms': round(median([s['first_request_s'] for s in samples]) * 1000, 1),
+        'process_ms': round(median([s['process_s'] for s in samples]) * 1000, 1),
+        'rss_mb': round(median([s['rss_kb'] for s in samples]) / 1024, 1),
+    }
+
+
+def measure_gunicorn(preload, runs, port):
+    """Seconds from launching gunicorn (1 worker) until it answers a request"""
+    drive = SyntheticDrive(1, 1, 1, 128)
+    graph = MockGraphServer(drive).start()
+    base_url = f'http://127.0.0.1:{port}'
+    samples = []
+    try:
+        for _ in range(runs):
+            start = time.perf_counter()
+            server = subprocess.Popen(
+                [sys.executable, '-m', 'benchmarks.serve', '--graph-url', graph.base_url,
+                 '--bind', f'127.0.0.1:{port}', '--workers', '1'],
+                cwd=REPO_ROOT, env=child_env(preload), stderr=subprocess.DEVNULL)
+            try:
+                wait_for_server(base_url, server)
+                samples.append(time.perf_counter() - start)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+            # Let the port be released before the next run
+            while True:
+                try:
+                    requests.get(base_url, timeout=0.2)
+                    time.sleep(0.05)
+                except requests.RequestException:
+                    break
+    finally:
+        graph.stop()
+    return {
+        'mode': 'preload' if preload else 'lazy',
+        'runs': runs,
+        'boot_to_first_response_ms': round(median(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--gunicorn', action='store_true', help='also measure gunicorn boot to first response')
+    parser.add_argument('--port', type=int, default=5056)
+    parser.add_argument('--json', dest='json_path', help='write results to this file')
+    args = parser.parse_args(argv)
+
+    results = {'import': [measure_import(preload, args.runs) for preload in (False, True)]}
+    print(format_table(results['import']))
+    if args.gunicorn:
+        results['gunicorn'] = [measure_gunicorn(preload, args.runs, args.port) for preload in (False, True)]
+        print()
+        print(format_table(results['gunicorn']))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Extracted file text shared by every user of a worker.
+
+Team folders are read by many people, and each of their assistants used to
+download and parse the same files into its own ``file_cache``. Entries here
+are keyed by the item's drive id, item id and cTag (which Graph changes
+whenever the content changes), so text is extracted once per file version.
+
+The cache never decides who may read a file: callers first fetch the item's
+metadata with the requesting user's own token and only look up the key built
+from that response, so a user can only hit entries for items Graph just
+confirmed they can access.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(metadata):
+    """Cache key for a driveItem metadata response, or None if it lacks a version"""
+    version = metadata.get('cTag') or metadata.get('eTag')
+    drive_id = metadata.get('parentReference', {}).get('driveId')
+    if not (version and drive_id and metadata.get('id')):
+        return None
+    return (drive_id, metadata['id'], version, metadata.get('name'))
+
+
+def text_bytes(text):
+    """Memory held by a str (1, 2 or 4 bytes per character plus header), not its character count"""
+    return sys.getsizeof(text)
+
+
+class SharedContentCache:
+    """Thread-safe LRU of extracted text bounded by the memory its strings occupy"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0  # bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            text = self._entries.get(key)
+            if text is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return text
+
+    def put(self, key, text):
+        if text_bytes(text) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= text_bytes(previous)
+            self._entries[key] = text
+            self.size += text_bytes(text)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= text_bytes(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
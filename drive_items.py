@@ -0,0 +1,104 @@
+"""Compact in-memory model for OneDrive items.
+
+Graph returns one JSON object per item; keeping those (or dicts rebuilt from
+them) around costs a hash table per item with the same keys repeated
+millions of times. ``DriveItem`` stores the handful of fields the app uses
+in ``__slots__``, shares folder path and drive id strings between siblings
+through ``sys.intern`` and converts to the JSON shapes served by the API on
+demand.
+
+Items shared from another drive (shortcuts, shared search results) arrive as
+a local stub with a ``remoteItem`` facet; they are modelled by the remote id
+and drive id, which identify the same file for every user who can see it.
+"""
+import sys
+
+FOLDER_ROOT = '/'
+
+
+def extension_of(name):
+    """Lower-case extension used for file-type dispatch, 'unknown' without one"""
+    return name.lower().rsplit('.', 1)[-1] if '.' in name else 'unknown'
+
+
+def child_path(folder_path, name):
+    """Path of ``name`` inside ``folder_path`` (both in the app's '/a/b' form)"""
+    return sys.intern(f"{folder_path.rstrip('/')}/{name}")
+
+
+class DriveItem:
+    """A file or folder from a Graph listing; folders may carry their children"""
+
+    __slots__ = ('id', 'name', 'size', 'last_modified', 'path', 'web_url', 'is_folder', 'children', 'drive_id')
+
+    def __init__(self, id, name, size=0, last_modified=None, path=FOLDER_ROOT, web_url=None,
+                 is_folder=False, children=None, drive_id=None):
+        self.id = id
+        self.drive_id = sys.intern(drive_id) if drive_id else None
+        self.name = name
+        self.size = size
+        self.last_modified = last_modified
+        self.path = sys.intern(path)
+        self.web_url = web_url
+        self.is_folder = is_folder
+        self.children = children
+
+    @classmethod
+    def from_graph(cls, item, path=None):
+        """Build from a Graph driveItem; ``path`` defaults to the item's parentReference path"""
+        if path is None:
+            path = item.get('parentReference', {}).get('path', FOLDER_ROOT)
+        target = item.get('remoteItem') or item
+        return cls(target.get('id'), item.get('name', 'Unknown'), target.get('size', item.get('size', 0)),
+                   item.get('lastModifiedDateTime'), path, item.get('webUrl'), 'folder' in target,
+                   drive_id=target.get('parentReference', {}).get('driveId'))
+
+    @property
+    def extension(self):
+        return extension_of(self.name)
+
+    @property
+    def full_path(self):
+        return child_path(self.path, self.name)
+
+    def iter_files(self):
+        """This item if it is a file, otherwise every file below it"""
+        if not self.is_folder:
+            yield self
+            return
+        for child in self.children or ():
+            yield from child.iter_files()
+
+    def to_tree_dict(self):
+        """Shape used by ``/api/directory``: folders nest their children, files carry an extension"""
+        data = {
+            'name': self.name,
+            'type': 'folder' if self.is_folder else 'file',
+            'id': self.id,
+            'size': self.size,
+            'last_modified': self.last_modified,
+            'path': self.path,
+            'web_url': self.web_url,
+            'drive_id': self.drive_id,
+        }
+        if self.is_folder:
+            data['children'] = [child.to_tree_dict() for child in self.children or ()]
+        else:
+            data['extension'] = self.extension
+        return data
+
+    def to_file_dict(self):
+        """Shape used by the flat file listings, where ``type`` is the extension"""
+        return {
+            'name': self.name,
+            'id': self.id,
+            'type': self.extension,
+            'size': self.size,
+            'last_modified': self.last_modified,
+            'path': self.path,
+            'web_url': self.web_url,
+            'drive_id': self.drive_id,
+        }
+
+    def __repr__(self):
+        return f"DriveItem({self.full_path!r}, folder={self.is_folder})"
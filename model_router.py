@@ -0,0 +1,142 @@
+"""Pick a Gemini model and generation settings per request.
+
+Routes are ordered cheapest first (``fast``, ``standard``, ``heavy``). A
+request's kind and prompt size select a route: general questions and small
+prompts go to the fast model, multi-file synthesis to the standard model and
+very large contexts to the heavy one. Every call records its latency and
+token usage per route. When a route's recent latency exceeds the budget,
+requests move to a cheaper route that is currently faster. If a route's
+model fails, the call falls through to the other routes.
+
+Models are created on first use, so startup makes no Gemini calls.
+"""
+import logging
+import threading
+import time
+
+from telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ROUTE_SECONDS = REGISTRY.histogram(
+    'onedrive_model_route_duration_seconds', 'Gemini call latency by route', ('route', 'model'))
+ROUTE_TOKENS = REGISTRY.counter(
+    'onedrive_model_route_tokens_total', 'Gemini tokens by route and direction', ('route', 'kind'))
+ROUTE_ERRORS = REGISTRY.counter(
+    'onedrive_model_route_errors_total', 'Failed Gemini calls by route', ('route',))
+
+# Request kinds that only need a quick, short answer
+LIGHT_KINDS = frozenset(('general', 'followup'))
+
+EWMA_WEIGHT = 0.2
+# Latency older than this is forgotten, so a route skipped for being slow is tried again
+LATENCY_MEMORY_SECONDS = 300
+
+
+class Route:
+    def __init__(self, name, model_name, max_output_tokens):
+        self.name = name
+        self.model_name = model_name
+        self.max_output_tokens = max_output_tokens
+
+    def __repr__(self):
+        return f"Route({self.name!r}, {self.model_name!r})"
+
+
+class ModelRouter:
+    """Chooses a route per request and keeps one lazily built model per route"""
+
+    def __init__(self, routes, model_factory, fast_max_chars, heavy_min_chars, latency_budget):
+        self.routes = list(routes)  # cheapest first
+        self.model_factory = model_factory  # callable(route) -> object with generate_content()
+        self.fast_max_chars = fast_max_chars
+        self.heavy_min_chars = heavy_min_chars
+        self.latency_budget = latency_budget
+        self._models = {}
+        self._latency = {}  # route name -> (EWMA seconds, last update)
+        self._lock = threading.Lock()
+
+    def route(self, name):
+        return next(r for r in self.routes if r.name == name)
+
+    def use_factory(self, model_factory):
+        """Swap how models are built (tests, benchmarks) and drop the ones already built"""
+        with self._lock:
+            self.model_factory = model_factory
+            self._models.clear()
+            self._latency.clear()
+
+    def model_for(self, route):
+        with self._lock:
+            model = self._models.get(route.name)
+            if model is None:
+                model = self._models[route.name] = self.model_factory(route)
+            return model
+
+    def default_model(self):
+        """Model of the standard route, used where a single model is needed (context caching)"""
+        return self.model_for(self.route('standard'))
+
+    def latency(self, route):
+        """Recent smoothed latency of a route in seconds, None if unknown or stale"""
+        ewma, updated_at = self._latency.get(route.name, (None, 0))
+        return ewma if time.time() - updated_at < LATENCY_MEMORY_SECONDS else None
+
+    def choose(self, kind, prompt_chars):
+        if prompt_chars <= self.fast_max_chars or (kind in LIGHT_KINDS and prompt_chars < self.heavy_min_chars):
+            name = 'fast'
+        elif prompt_chars >= self.heavy_min_chars and kind not in LIGHT_KINDS:
+            name = 'heavy'
+        else:
+            name = 'standard'
+        chosen = self.route(name)
+
+        # Over budget: use a cheaper route that is currently faster (or not yet measured)
+        latency = self.latency(chosen)
+        if latency is not None and latency > self.latency_budget:
+            for route in self.routes[:self.routes.index(chosen)]:
+                cheaper = self.latency(route)
+                if cheaper is None or cheaper < latency:
+                    logger.debug(f"Route {chosen.name} over latency budget ({latency:.1f}s), using {route.name}")
+                    return route
+        return chosen
+
+    def generate(self, prompt, kind):
+        """Generate with the chosen route, falling through to the others on failure; returns (response, route)"""
+        chosen = self.choose(kind, len(prompt))
+        position = self.routes.index(chosen)
+        # More capable routes first, then cheaper ones
+        candidates = self.routes[position:] + self.routes[:position][::-1]
+        last_error = None
+        for route in candidates:
+            try:
+                start = time.perf_counter()
+                response = self.model_for(route).generate_content(prompt)
+                self.record(route, time.perf_counter() - start, getattr(response, 'usage_metadata', None))
+                return response, route
+            except Exception as e:
+                ROUTE_ERRORS.inc(route=route.name)
+                # Treat a failing route as infinitely slow so it is skipped until its latency is forgotten
+                with self._lock:
+                    self._latency[route.name] = (float('inf'), time.time())
+                logger.warning(f"Model {route.model_name} ({route.name}) failed: {e}")
+                last_error = e
+        raise last_error
+
+    def record(self, route, seconds, usage=None):
+        ROUTE_SECONDS.observe(seconds, route=route.name, model=route.model_name)
+        if usage:
+            ROUTE_TOKENS.inc(getattr(usage, 'prompt_token_count', 0) or 0, route=route.name, kind='prompt')
+            ROUTE_TOKENS.inc(getattr(usage, 'candidates_token_count', 0) or 0, route=route.name, kind='completion')
+        with self._lock:
+            previous = self.latency(route)
+            # A success after a failure (recorded as inf) starts a fresh average
+            if previous is None or previous == float('inf'):
+                ewma = seconds
+            else:
+                ewma = (1 - EWMA_WEIGHT) * previous + EWMA_WEIGHT * seconds
+            self._latency[route.name] = (ewma, time.time())
+
+    def stats(self):
+        with self._lock:
+            return {r.name: {'model': r.model_name, 'latency_ewma_s': self.latency(r)} for r in self.routes}
@@ -0,0 +1,89 @@
+"""Background warm-up of file content ahead of a question.
+
+The file browser reports the current selection as soon as it changes, and
+the app queues downloads and extractions for it here. By the time the
+question is submitted the content is usually in the assistant's cache, and
+a download still running when it arrives is joined through the existing
+single-flight instead of being started again.
+
+Prefetching never competes with requests: a few daemon workers drain a
+bounded priority queue (explicitly selected files before folder contents),
+a key already queued or running is not queued again and work beyond the
+queue bound is dropped rather than delayed. Workers start on first use.
+"""
+import itertools
+import logging
+import queue
+import threading
+
+from telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_TASKS = REGISTRY.counter(
+    'onedrive_prefetch_tasks_total', 'Prefetch tasks by outcome', ('outcome',))
+
+# Lower runs first
+PRIORITY_SELECTED = 0
+PRIORITY_FOLDER_FILE = 1
+
+
+class Prefetcher:
+    """Deduplicated, bounded low-priority work queue served by a few daemon threads"""
+
+    def __init__(self, workers, max_pending):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()  # FIFO within a priority
+        self._keys = set()  # queued or running
+        self._threads = []
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.workers > 0 and self.max_pending > 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    def submit(self, key, fn, *args, priority=PRIORITY_SELECTED):
+        """Queue ``fn(*args)`` unless ``key`` is already pending; returns whether it was queued"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if key in self._keys:
+                PREFETCH_TASKS.inc(outcome='duplicate')
+                return False
+            if len(self._keys) >= self.max_pending:
+                PREFETCH_TASKS.inc(outcome='dropped')
+                return False
+            self._keys.add(key)
+            self._start_workers()
+        self._queue.put((priority, next(self._order), key, fn, args))
+        PREFETCH_TASKS.inc(outcome='queued')
+        return True
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._run, name=f'prefetch-{len(self._threads)}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            _, _, key, fn, args = self._queue.get()
+            try:
+                fn(*args)
+                PREFETCH_TASKS.inc(outcome='done')
+            except Exception as e:
+                PREFETCH_TASKS.inc(outcome='failed')
+                logger.debug(f"Prefetch {key!r} failed: {e}")
+            finally:
+                with self._lock:
+                    self._keys.discard(key)
+                self._queue.task_done()
+
+    def join(self):
+        """Block until everything queued so far has run (benchmarks, tests)"""
+        self._queue.join()
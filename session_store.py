@@ -0,0 +1,205 @@
+"""Server-side Flask sessions with compact storage and TTL expiry.
+
+Session data is serialized with Flask's tagged JSON (compact separators) and
+kept in a shared store keyed by a random, signed session id:
+
+* ``sqlite`` - a WAL-mode SQLite file, safe for every worker on one host
+* ``redis``  - any Redis-protocol server, for multi-node deployments
+* ``cookie`` - Flask's signed-cookie sessions, no server-side I/O at all
+
+Stores are only written when the session changes, or when less than half of
+its TTL remains, so most requests cost a single indexed read.
+"""
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+
+logger = logging.getLogger(__name__)
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires_at=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires_at = expires_at
+        self.modified = False
+
+
+class SqliteSessionStore:
+    """Sessions in a SQLite table; one connection per thread and process"""
+
+    PURGE_EVERY = 500  # writes between sweeps of expired rows
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('CREATE TABLE IF NOT EXISTS sessions '
+                     '(sid TEXT PRIMARY KEY, data BLOB NOT NULL, expires_at REAL NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)')
+
+    def _connection(self):
+        # Connections must not cross a fork (gunicorn workers) or be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, sid):
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at > ?', (sid, time.time())).fetchone()
+        return (bytes(row[0]), row[1]) if row else (None, None)
+
+    def set(self, sid, data, ttl):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)',
+                     (sid, data, time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),))
+
+    def touch(self, sid, ttl):
+        self._connection().execute('UPDATE sessions SET expires_at = ? WHERE sid = ?', (time.time() + ttl, sid))
+
+    def delete(self, sid):
+        self._connection().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+
+class RedisSessionStore:
+    """Sessions in Redis (or any server speaking its protocol) with native TTLs"""
+
+    def __init__(self, url, prefix='session:'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, sid):
+        key = self.prefix + sid
+        pipe = self.client.pipeline()
+        pipe.get(key)
+        pipe.ttl(key)
+        data, ttl = pipe.execute()
+        if data is None:
+            return None, None
+        return data, time.time() + max(ttl, 0)
+
+    def set(self, sid, data, ttl):
+        self.client.setex(self.prefix + sid, int(ttl), data)
+
+    def touch(self, sid, ttl):
+        self.client.expire(self.prefix + sid, int(ttl))
+
+    def delete(self, sid):
+        self.client.delete(self.prefix + sid)
+
+
+class ServerSideSessionInterface(SessionInterface):
+    session_class = ServerSideSession
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='onedrive-session')
+
+    def _new_session(self):
+        return self.session_class(sid=secrets.token_urlsafe(32), new=True)
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return self._new_session()
+        try:
+            sid = self._signer(app).unsign(cookie).decode()
+        except BadSignature:
+            return self._new_session()
+        try:
+            data, expires_at = self.store.get(sid)
+        except Exception as e:
+            logger.warning(f"Session store read failed: {e}")
+            data = None
+        if data is None:
+            return self._new_session()
+        try:
+            return self.session_class(serializer.loads(data), sid=sid, expires_at=expires_at)
+        except ValueError:
+            return self._new_session()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        if not session:
+            if session.modified and not session.new:
+                try:
+                    self.store.delete(session.sid)
+                except Exception as e:
+                    logger.warning(f"Session store delete failed: {e}")
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        try:
+            if session.modified:
+                self.store.set(session.sid, serializer.dumps(dict(session)).encode(), self.ttl)
+            elif session.expires_at and session.expires_at - time.time() < self.ttl / 2:
+                self.store.touch(session.sid, self.ttl)
+            else:
+                return
+        except Exception as e:
+            # Serve the response anyway; the session is simply not persisted this time
+            logger.warning(f"Session store write failed: {e}")
+            return
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def create_session_interface(config, instance_path):
+    """Build the session interface named by ``SESSION_BACKEND`` in the app config"""
+    backend = config.get('SESSION_BACKEND', 'sqlite')
+    ttl = int(config.get('SESSION_TTL', 86400))
+    if backend == 'cookie':
+        return SecureCookieSessionInterface()
+    if backend == 'redis':
+        store = RedisSessionStore(config['SESSION_REDIS_URL'])
+    elif backend == 'sqlite':
+        path = config.get('SESSION_SQLITE_PATH') or os.path.join(instance_path, 'sessions.sqlite3')
+        store = SqliteSessionStore(path)
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return ServerSideSessionInterface(store, ttl)
@@ -0,0 +1,58 @@
+"""Collapse concurrent identical calls into one execution.
+
+When several threads ask for the same key at once (a double-submitted chat,
+a few tabs loading ``/chat`` on a cold cache), the first caller runs the
+function and the others block until it finishes and receive the same result
+or exception. Nothing is cached: once the call completes, the next caller
+for that key runs it again, so this composes with the existing caches rather
+than replacing them.
+"""
+import threading
+
+from telemetry import REGISTRY
+
+SHARED_CALLS = REGISTRY.counter(
+    'onedrive_singleflight_shared_total', 'Calls that waited on an identical in-flight call', ('group',))
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Per-key deduplication of concurrent calls; ``group`` labels the metric"""
+
+    def __init__(self, group):
+        self.group = group
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            SHARED_CALLS.inc(group=self.group)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
@@ -1,7 +1,15 @@
+// Shared by every ChatApp instance so one selection change sends one notification
+let selectionNotifyTimer = null;
+const SELECTION_NOTIFY_DELAY_MS = 300;
+
 class ChatApp {
     constructor() {
         this.selectedFiles = [];
         this.viewMode = 'list';
+        // Follow-up questions in this conversation reuse the server-side file context
+        this.conversationId = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
         this.initializeEventListeners();
         this.updateCurrentTime();
         this.initializeFileSelection();
@@ -54,9 +62,10 @@ class ChatApp {
                 const fileName = fileItem.dataset.name;
                 const fileType = fileItem.dataset.type;
                 const fileExtension = fileItem.dataset.extension;
+                const driveId = fileItem.dataset.driveId;
                 
                 console.log('Checkbox clicked for:', fileName);
-                this.toggleFileSelection(fileId, fileName, fileType, fileExtension);
+                this.toggleFileSelection(fileId, fileName, fileType, fileExtension, driveId);
             }
             // Handle file item clicks (but not checkbox clicks)
             else if (e.target.closest('.file-item') && e.target.type !== 'checkbox') {
@@ -65,14 +74,15 @@ class ChatApp {
                 const fileName = fileItem.dataset.name;
                 const fileType = fileItem.dataset.type;
                 const fileExtension = fileItem.dataset.extension;
+                const driveId = fileItem.dataset.driveId;
                 
                 console.log('File item clicked:', fileName);
-                this.toggleFileSelection(fileId, fileName, fileType, fileExtension);
+                this.toggleFileSelection(fileId, fileName, fileType, fileExtension, driveId);
             }
         });
     }
 
-    toggleFileSelection(fileId, fileName, fileType, fileExtension) {
+    toggleFileSelection(fileId, fileName, fileType, fileExtension, driveId) {
         console.log('Toggle selection called for:', fileName);
         
         // Find if file is already selected
@@ -88,7 +98,8 @@ class ChatApp {
                 id: fileId,
                 name: fileName,
                 type: fileType,
-                extension: fileExtension
+                extension: fileExtension,
+                drive_id: driveId
             });
             console.log(`✅ Added ${fileName} to selection`);
         }
@@ -97,7 +108,7 @@ class ChatApp {
         this.updateSelectionUI();
     }
 
-    selectFile(fileId, fileName, fileType, fileExtension) {
+    selectFile(fileId, fileName, fileType, fileExtension, driveId) {
         // Add file to selection if not already selected
         const existingIndex = this.selectedFiles.findIndex(f => f.id === fileId);
         if (existingIndex === -1) {
@@ -105,7 +116,8 @@ class ChatApp {
                 id: fileId,
                 name: fileName,
                 type: fileType,
-                extension: fileExtension
+                extension: fileExtension,
+                drive_id: driveId
             });
         }
         
@@ -193,6 +205,26 @@ class ChatApp {
             selectedCount: this.selectedFiles.length,
             selectedFiles: this.selectedFiles.map(f => f.name)
         });
+
+        this.notifySelection();
+    }
+
+    notifySelection() {
+        // Let the server start downloading the selection while the question is typed
+        clearTimeout(selectionNotifyTimer);
+        if (this.selectedFiles.length === 0) {
+            return;
+        }
+        const selectedItems = this.selectedFiles.slice();
+        selectionNotifyTimer = setTimeout(() => {
+            fetch('/api/selection', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ selected_items: selectedItems })
+            }).catch(error => console.log('Selection prefetch skipped:', error));
+        }, SELECTION_NOTIFY_DELAY_MS);
     }
 
     getFileIcon(extension) {
@@ -227,12 +259,14 @@ class ChatApp {
             const fileName = item.dataset.name;
             const fileType = item.dataset.type;
             const fileExtension = item.dataset.extension;
+            const driveId = item.dataset.driveId;
             
             this.selectedFiles.push({
                 id: fileId,
                 name: fileName,
                 type: fileType,
-                extension: fileExtension
+                extension: fileExtension,
+                drive_id: driveId
             });
         });
         
@@ -283,7 +317,8 @@ class ChatApp {
             // Prepare request data with selected files
             const requestData = {
                 question: message,
-                selected_items: this.selectedFiles
+                selected_items: this.selectedFiles,
+                conversation_id: this.conversationId
             };
 
             console.log('Sending message with selected files:', this.selectedFiles);
@@ -408,11 +443,11 @@ function unselectFile(fileId) {
     }
 }
 
-function toggleFileSelection(fileId, fileName, fileType, fileExtension) {
-    console.log('Global toggleFileSelection called:', { fileId, fileName, fileType, fileExtension });
+function toggleFileSelection(fileId, fileName, fileType, fileExtension, driveId) {
+    console.log('Global toggleFileSelection called:', { fileId, fileName, fileType, fileExtension, driveId });
     
     if (window.chatApp) {
-        window.chatApp.toggleFileSelection(fileId, fileName, fileType, fileExtension);
+        window.chatApp.toggleFileSelection(fileId, fileName, fileType, fileExtension, driveId);
     } else {
         console.error('chatApp not found!');
     }
@@ -425,8 +460,8 @@ function toggleViewMode() {
 }
 
 function reinitializeFiles() {
-    // Reload the page to refresh files
-    window.location.reload();
+    // Reload the page, asking the server to crawl OneDrive again
+    window.location.replace('/chat?refresh=1');
 }
 
 function clearCache() {
@@ -0,0 +1,241 @@
+"""Request tracing and Prometheus metrics for the OneDrive assistant.
+
+Spans wrap the hot-path phases (Graph listing, download, extraction, prompt
+build, Gemini call).  Every finished span is observed into an in-process
+histogram, and well-known span attributes (bytes, cache hits, token counts)
+feed the matching counters.  ``render_metrics()`` produces the Prometheus
+text exposition format served on ``/metrics``.
+
+Metrics are per process: under gunicorn each worker exposes its own values.
+"""
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+# Emit per-request ``Server-Timing`` headers when enabled
+TIMING_HEADERS = os.getenv('TIMING_HEADERS', 'false').lower() in ('1', 'true', 'yes')
+
+# Label values must come from fixed sets: anything client-controlled is bucketed first
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ''
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def collect(self):
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} callback failed: {e}")
+            return []
+        return [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} gauge', f'{self.name} {value}']
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labelnames + ('le',), key + (repr(bound),))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labelnames + ('le',), key + ('+Inf',))
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {series[-2]}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help_text, callback):
+        metric = Gauge(name, help_text, callback)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    'onedrive_span_duration_seconds', 'Duration of traced assistant phases', ('span', 'kind'))
+SPAN_BYTES = REGISTRY.counter(
+    'onedrive_span_bytes_total', 'Bytes transferred or produced by traced phases', ('span', 'kind'))
+CACHE_LOOKUPS = REGISTRY.counter(
+    'onedrive_cache_lookups_total', 'Cache lookups by traced phase and result', ('span', 'result'))
+GEMINI_TOKENS = REGISTRY.counter(
+    'onedrive_gemini_tokens_total', 'Gemini tokens by direction', ('kind',))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'onedrive_request_duration_seconds', 'HTTP request latency', ('endpoint', 'method', 'status'))
+
+
+class Span:
+    __slots__ = ('name', 'attrs', 'duration')
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.duration = 0.0
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def trace_span(name, **attrs):
+    """Time a phase and record it as a metric and on the current request.
+
+    Recognised attributes: ``kind`` (sub-type label), ``bytes``,
+    ``cache_hit``, ``prompt_tokens`` and ``completion_tokens``.
+    """
+    span = Span(name, attrs)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span.duration = time.perf_counter() - start
+        _record(span)
+
+
+def _record(span):
+    attrs = span.attrs
+    kind = attrs.get('kind', '')
+    SPAN_SECONDS.observe(span.duration, span=span.name, kind=kind)
+    if attrs.get('bytes'):
+        SPAN_BYTES.inc(attrs['bytes'], span=span.name, kind=kind)
+    if 'cache_hit' in attrs:
+        CACHE_LOOKUPS.inc(span=span.name, result='hit' if attrs['cache_hit'] else 'miss')
+    if attrs.get('prompt_tokens'):
+        GEMINI_TOKENS.inc(attrs['prompt_tokens'], kind='prompt')
+    if attrs.get('completion_tokens'):
+        GEMINI_TOKENS.inc(attrs['completion_tokens'], kind='completion')
+    if has_request_context():
+        g.setdefault('spans', []).append(span)
+    logger.debug("span %s %.1fms %s", span.name, span.duration * 1000, attrs)
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+def server_timing(spans):
+    """Aggregate spans by name into a ``Server-Timing`` header value"""
+    totals = {}
+    for span in spans:
+        duration, count = totals.get(span.name, (0.0, 0))
+        totals[span.name] = (duration + span.duration, count + 1)
+    return ', '.join(
+        f'{name};dur={duration * 1000:.1f};desc="{count}x"' for name, (duration, count) in totals.items())
+
+
+def init_app(app):
+    """Install request timing hooks on a Flask app"""
+
+    @app.before_request
+    def _start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_timer(response):
+        started = g.pop('request_started', None)
+        if started is None:
+            return response
+        duration = time.perf_counter() - started
+        method = request.method if request.method in HTTP_METHODS else 'other'
+        REQUEST_SECONDS.observe(duration, endpoint=request.endpoint or 'unknown',
+                                method=method, status=response.status_code)
+        if TIMING_HEADERS:
+            spans = g.get('spans', [])
+            timing = f'total;dur={duration * 1000:.1f}'
+            if spans:
+                timing += ', ' + server_timing(spans)
+            response.headers['Server-Timing'] = timing
+        return response
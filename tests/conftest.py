@@ -0,0 +1,22 @@
+import pytest
+
+from benchmarks.harness import load_app
+from benchmarks.mock_graph import MockGraphServer, SyntheticDrive
+
+
+@pytest.fixture(scope='session')
+def graph():
+    # 85 folders x 8 files: large enough that listing the drive takes many pages
+    server = MockGraphServer(SyntheticDrive(3, 4, 8, 256), latency_ms=0).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture(scope='session')
+def app_module(graph):
+    return load_app(graph.base_url)
+
+
+@pytest.fixture
+def assistant(app_module):
+    return app_module.OneDriveGeminiAssistant('test-token')
@@ -0,0 +1,29 @@
+def packed_conversation(app_module):
+    conversation = app_module.Conversation('c1')
+    context = "Selected Items Content:\n\n" + "".join(
+        f"--- {name}.txt ---\n{name} " + 'detail ' * 400 + "\n\n" for name in ('budget', 'roadmap', 'invoice'))
+    conversation.set_context(('a', 'b', 'c'), context)
+    return conversation
+
+
+def test_follow_up_context_is_complete_by_default(app_module):
+    conversation = packed_conversation(app_module)
+    assert app_module.FOLLOWUP_CONTEXT_MAX_CHARS == 0
+    assert conversation.context_excerpt('and the budget?', app_module.FOLLOWUP_CONTEXT_MAX_CHARS) == conversation.context
+
+
+def test_follow_up_excerpt_favours_mentioned_files(app_module):
+    conversation = packed_conversation(app_module)
+    excerpt = conversation.context_excerpt('what about the roadmap?', 1000)
+    assert len(excerpt) <= 1000 + len('\n...\n\n')
+    assert '--- roadmap.txt ---' in excerpt
+    assert '--- budget.txt ---' not in excerpt
+
+
+def test_history_is_bounded(app_module):
+    conversation = app_module.Conversation('c1')
+    for i in range(app_module.HISTORY_MAX_TURNS + 5):
+        conversation.add_turn(f'question {i}', f'answer {i}')
+    assert len(conversation.history) == app_module.HISTORY_MAX_TURNS
+    assert conversation.history[-1] == (f'question {app_module.HISTORY_MAX_TURNS + 4}',
+                                        f'answer {app_module.HISTORY_MAX_TURNS + 4}')
@@ -0,0 +1,42 @@
+import pytest
+
+
+def graph_calls(graph, fn, *args, **kwargs):
+    before = graph.request_count
+    result = fn(*args, **kwargs)
+    return result, graph.request_count - before
+
+
+@pytest.mark.parametrize('question', [
+    'summarize my pdfs',            # type hint matching nothing
+    'quarterly budget pdf',         # keywords match, type does not
+    'PDFs from this week',
+    'csv files from this week',     # type matches, date does not
+    'what are the main topics',
+])
+def test_discovery_never_lists_the_whole_drive(app_module, graph, assistant, question):
+    files, calls = graph_calls(graph, assistant.discover_files, question, limit=10)
+    max_pages = -(-app_module.SEARCH_MAX_SCANNED // app_module.SEARCH_PAGE_SIZE)
+    assert calls <= max_pages + 1, f"{question!r} made {calls} Graph calls"
+    assert len(files) <= 10
+
+
+def test_type_hint_is_kept(graph, assistant):
+    files, calls = graph_calls(graph, assistant.discover_files, 'show me csv files', limit=10)
+    assert files and all(f['type'] == 'csv' for f in files)
+    assert calls == 1
+
+
+def test_unmatched_type_returns_nothing(graph, assistant):
+    files, calls = graph_calls(graph, assistant.discover_files, 'summarize my pdfs', limit=10)
+    assert files == []
+    assert calls == 1
+
+
+def test_flat_listing_is_bounded(graph, assistant):
+    files, calls = graph_calls(graph, assistant.get_all_files_flat, limit=5)
+    assert len(files) == 5
+    assert calls == 1
+    files, calls = graph_calls(graph, assistant.get_all_files_flat)
+    assert len(files) == len(graph.drive.files)
+    assert calls <= -(-len(graph.drive.items) // 200)
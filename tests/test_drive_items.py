@@ -0,0 +1,39 @@
+from benchmarks.mock_graph import DRIVE_ID
+from drive_items import DriveItem
+
+
+def test_shortcut_is_addressed_by_remote_item():
+    stub = {
+        'id': 'local-stub', 'name': 'Team budget.xlsx', 'size': 0,
+        'parentReference': {'driveId': 'b!mine', 'path': '/drive/root:'},
+        'remoteItem': {'id': 'remote-id', 'size': 2048, 'file': {},
+                       'parentReference': {'driveId': 'b!team'}},
+    }
+    item = DriveItem.from_graph(stub)
+    assert (item.id, item.drive_id, item.size, item.is_folder) == ('remote-id', 'b!team', 2048, False)
+    assert item.to_file_dict()['drive_id'] == 'b!team'
+
+    folder = DriveItem.from_graph({'id': 'stub', 'name': 'Team', 'remoteItem': {'id': 'r', 'folder': {}}})
+    assert folder.is_folder
+
+
+def test_own_items_carry_their_drive_id(assistant):
+    files = assistant.get_all_files_flat(limit=1)
+    assert files[0]['drive_id'] == DRIVE_ID
+
+
+def test_drive_id_reaches_other_users_extraction(app_module, graph, assistant):
+    file = assistant.get_all_files_flat(limit=1)[0]
+    app_module.shared_content.clear()
+    first = assistant.download_file_content(file['id'], file['name'], file['type'])
+
+    # Another user reads the same file through its drive: one metadata call, no download
+    other = app_module.OneDriveGeminiAssistant('other-token')
+    before = graph.request_count
+    second = other.download_file_content(file['id'], file['name'], file['type'], file['drive_id'])
+    assert second == first
+    assert graph.request_count - before == 1
+
+    # The access check goes to the item's own drive, so a wrong drive is refused
+    other.clear_cache()
+    assert other.download_file_content(file['id'], file['name'], file['type'], 'b!elsewhere') != first
@@ -0,0 +1,87 @@
+import pytest
+
+from model_router import ModelRouter, Route
+
+
+class FakeModel:
+    def __init__(self, route, fail=0):
+        self.route = route
+        self.fail = fail  # number of upcoming calls that raise
+        self.calls = 0
+
+    def generate_content(self, prompt):
+        self.calls += 1
+        if self.fail:
+            self.fail -= 1
+            raise RuntimeError(f"{self.route.name} unavailable")
+        return f"{self.route.name}: {prompt}"
+
+
+def make_router(latency_budget=20):
+    models = {}
+
+    def factory(route):
+        return models.setdefault(route.name, FakeModel(route))
+
+    router = ModelRouter([Route('fast', 'fast-model', 1024), Route('standard', 'standard-model', 4096),
+                          Route('heavy', 'heavy-model', 8192)],
+                         factory, fast_max_chars=100, heavy_min_chars=1000, latency_budget=latency_budget)
+    return router, models
+
+
+@pytest.mark.parametrize('kind, prompt_chars, expected', [
+    ('selected', 50, 'fast'),
+    ('selected', 500, 'standard'),
+    ('selected', 5000, 'heavy'),
+    ('general', 500, 'fast'),
+    ('general', 5000, 'standard'),
+])
+def test_choose_by_kind_and_size(kind, prompt_chars, expected):
+    router, _ = make_router()
+    assert router.choose(kind, prompt_chars).name == expected
+
+
+def test_choose_moves_to_cheaper_route_over_budget():
+    router, _ = make_router(latency_budget=1)
+    router.record(router.route('standard'), 5)
+    assert router.choose('selected', 500).name == 'fast'
+    router.record(router.route('fast'), 10)
+    assert router.choose('selected', 500).name == 'standard'
+
+
+def test_generate_falls_through_on_failure():
+    router, models = make_router()
+    router.model_for(router.route('standard')).fail = 1
+    response, route = router.generate('x' * 500, 'selected')
+    assert route.name == 'heavy'
+    assert response.startswith('heavy')
+    assert router.latency(router.route('standard')) == float('inf')
+
+
+def test_generate_raises_when_every_route_fails():
+    router, _ = make_router()
+    for route in router.routes:
+        router.model_for(route).fail = 1
+    with pytest.raises(RuntimeError):
+        router.generate('prompt', 'selected')
+
+
+def test_record_averages_latency():
+    router, _ = make_router()
+    fast = router.route('fast')
+    router.record(fast, 1.0)
+    router.record(fast, 2.0)
+    assert router.latency(fast) == pytest.approx(1.2)
+
+
+def test_record_recovers_after_failure():
+    router, _ = make_router(latency_budget=1)
+    router.model_for(router.route('fast')).fail = 1
+    router.generate('short', 'general')
+    assert router.stats()['fast']['latency_ewma_s'] == float('inf')
+
+    router.record(router.route('fast'), 0.5)
+    assert router.stats()['fast']['latency_ewma_s'] == pytest.approx(0.5)
+    # The recovered fast route is again a fallback for an over-budget standard route
+    router.record(router.route('standard'), 5)
+    assert router.choose('selected', 500).name == 'fast'
@@ -0,0 +1,35 @@
+import telemetry
+
+
+def metric_lines(client):
+    return client.get('/metrics').get_data(as_text=True).count('\n')
+
+
+def test_client_supplied_extensions_do_not_add_series(app_module, graph, assistant):
+    item = graph.drive.files[0]
+    client = app_module.app.test_client()
+    for _ in range(2):
+        # Warm up the same path the loop takes: per-user cache cleared, shared cache hit
+        assistant.clear_cache()
+        assistant.download_file_content(item['id'], item['name'], 'warmup')
+    metric_lines(client)  # the first scrape adds the /metrics request series itself
+    before = metric_lines(client)
+    for i in range(50):
+        assistant.clear_cache()
+        assistant.download_file_content(item['id'], item['name'], f'ext{i}')
+    assert metric_lines(client) == before
+
+
+def test_file_kind_is_bounded(app_module):
+    assert app_module.file_kind('pdf') == 'pdf'
+    assert app_module.file_kind('2 final') == 'other'
+    assert app_module.file_kind('') == 'other'
+
+
+def test_unknown_http_methods_share_one_label(app_module):
+    client = app_module.app.test_client()
+    for method in ('FOO', 'BAR', 'BAZ'):
+        client.open('/metrics', method=method)
+    methods = {key[1] for key in telemetry.REQUEST_SECONDS._series}
+    assert 'other' in methods
+    assert not methods & {'FOO', 'BAR', 'BAZ'}
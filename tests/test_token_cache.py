@@ -0,0 +1,97 @@
+import sys
+import types
+
+import pytest
+
+from benchmarks.fake_msal import FakeConfidentialClientApplication
+from token_cache import TokenManager
+
+
+class FakeRedis:
+    """The hash, WATCH/MULTI subset RedisTokenCache uses, shared like one Redis server"""
+
+    class WatchError(Exception):
+        pass
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def from_url(cls, url, _servers={}):
+        return cls(_servers.setdefault(url, {'hashes': {}, 'writes': 0}))
+
+    def hmget(self, key, *fields):
+        stored = self.data['hashes'].get(key, {})
+        return [stored.get(field) for field in fields]
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def watch(self, key):
+        self.watched = self.client.data['writes']
+
+    def hmget(self, key, *fields):
+        return self.client.hmget(key, *fields)
+
+    def multi(self):
+        self.queued = []
+
+    def hset(self, key, mapping):
+        self.queued.append((key, mapping))
+
+    def execute(self):
+        if self.client.data['writes'] != self.watched:
+            raise FakeRedis.WatchError()
+        for key, mapping in self.queued:
+            self.client.data['hashes'][key] = {k: str(v).encode() for k, v in mapping.items()}
+            self.client.data['writes'] += 1
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    module = types.SimpleNamespace(Redis=FakeRedis, WatchError=FakeRedis.WatchError)
+    monkeypatch.setitem(sys.modules, 'redis', module)
+
+
+def token_manager(tmp_path, name, redis_url=None):
+    return TokenManager('client', 'authority', 'secret', ['Files.Read'], str(tmp_path / f'{name}.sqlite3'),
+                        app_factory=FakeConfidentialClientApplication, redis_url=redis_url)
+
+
+def test_sqlite_cache_is_shared_by_workers_on_a_host(tmp_path):
+    worker_a = token_manager(tmp_path, 'host')
+    worker_b = token_manager(tmp_path, 'host')
+    account_id = worker_a.acquire_token_by_authorization_code('alice', 'https://app/callback')['account_id']
+    assert worker_b.acquire_token_silent(account_id)['access_token'] == 'mock-token-alice'
+
+
+def test_sqlite_cache_is_not_shared_across_hosts(tmp_path):
+    host_a = token_manager(tmp_path, 'host-a')
+    host_b = token_manager(tmp_path, 'host-b')
+    account_id = host_a.acquire_token_by_authorization_code('alice', 'https://app/callback')['account_id']
+    assert host_b.acquire_token_silent(account_id) is None
+
+
+def test_redis_cache_is_shared_across_hosts(tmp_path, fake_redis):
+    host_a = token_manager(tmp_path, 'host-a', redis_url='redis://shared/0')
+    host_b = token_manager(tmp_path, 'host-b', redis_url='redis://shared/0')
+    alice = host_a.acquire_token_by_authorization_code('alice', 'https://app/callback')['account_id']
+    bob = host_b.acquire_token_by_authorization_code('bob', 'https://app/callback')['account_id']
+    # Merged writes: neither login dropped the other's account
+    assert host_b.acquire_token_silent(alice)['access_token'] == 'mock-token-alice'
+    assert host_a.acquire_token_silent(bob)['access_token'] == 'mock-token-bob'
+
+    host_b.remove_account(alice)
+    assert host_a.acquire_token_silent(alice) is None
@@ -0,0 +1,246 @@
+"""Shared MSAL client with a persistent, worker-safe token cache.
+
+One ``ConfidentialClientApplication`` is built lazily per process and backed
+by a ``SerializableTokenCache`` stored in SQLite, which every gunicorn worker
+on the host reads, or in Redis, which every host reads. The cache is reloaded
+when another worker has written a newer version, and writes merge into the
+stored state inside a transaction so concurrent refreshes do not drop each
+other's tokens. Graph clients call ``acquire_token_silent`` to transparently refresh
+expired access tokens from the cached refresh token.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from msal import ConfidentialClientApplication, SerializableTokenCache
+
+logger = logging.getLogger(__name__)
+
+
+def merge_cache_state(base, overlay):
+    """Overlay MSAL cache sections (AccessToken, RefreshToken, ...) onto base"""
+    merged = {section: dict(entries) for section, entries in base.items()}
+    for section, entries in overlay.items():
+        merged.setdefault(section, {}).update(entries)
+    return merged
+
+
+class SharedTokenCache(SerializableTokenCache):
+    """MSAL token cache kept in a versioned store shared with other workers.
+
+    Subclasses implement ``_load_if_newer()`` and ``_transaction(build_state)``.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._version = 0
+
+    def reload_if_stale(self):
+        """Pick up tokens written by other workers since our last load or save"""
+        if self.has_state_changed:
+            # A concurrent MSAL call has unsaved tokens; its save() merges with the stored state
+            return
+        self._load_if_newer()
+
+    def save(self):
+        """Merge in-memory changes into the stored cache"""
+        if not self.has_state_changed:
+            return
+        with self._lock:
+            ours = self._cache
+        self._transaction(lambda stored: merge_cache_state(stored, ours))
+
+    def replace(self, mutate):
+        """Apply ``mutate(cache)`` to the freshest stored state and store the result as-is.
+
+        Used for removals, which a merge would otherwise resurrect.
+        """
+        def apply(stored):
+            self.deserialize(json.dumps(stored))
+            mutate(self)
+            with self._lock:
+                return self._cache
+        self._transaction(apply)
+
+    def _adopt(self, version, state):
+        self.deserialize(state)
+        self._version = version
+
+
+class SqliteTokenCache(SharedTokenCache):
+    """MSAL token cache persisted to a SQLite file shared by local workers"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS token_cache '
+                         '(id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL, state TEXT NOT NULL)')
+        finally:
+            conn.close()
+        try:
+            os.chmod(path, 0o600)  # refresh tokens live here
+        except OSError:
+            pass
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _read(self, conn):
+        row = conn.execute('SELECT version, state FROM token_cache WHERE id = 1').fetchone()
+        return row if row else (0, '{}')
+
+    def _write(self, conn, version, state):
+        conn.execute('INSERT INTO token_cache (id, version, state) VALUES (1, ?, ?) '
+                     'ON CONFLICT(id) DO UPDATE SET version = excluded.version, state = excluded.state',
+                     (version, state))
+
+    def _load_if_newer(self):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT version FROM token_cache WHERE id = 1').fetchone()
+            if row and row[0] != self._version:
+                self._adopt(*self._read(conn))
+        finally:
+            conn.close()
+
+    def _transaction(self, build_state):
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            version, state = self._read(conn)
+            new_state = json.dumps(build_state(json.loads(state)))
+            self._write(conn, version + 1, new_state)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        self._adopt(version + 1, new_state)
+
+
+class RedisTokenCache(SharedTokenCache):
+    """MSAL token cache in Redis, shared by workers on every host"""
+
+    def __init__(self, url, key='onedrive:msal_token_cache'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("A Redis token cache requires the 'redis' package")
+        super().__init__()
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+        self._watch_error = redis.WatchError
+
+    def _load_if_newer(self):
+        version, state = self.client.hmget(self.key, 'version', 'state')
+        if version is not None and int(version) != self._version:
+            self._adopt(int(version), state.decode())
+
+    def _transaction(self, build_state):
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic: retried if another worker writes between the read and the write
+                    pipe.watch(self.key)
+                    version, state = pipe.hmget(self.key, 'version', 'state')
+                    version = int(version or 0)
+                    new_state = json.dumps(build_state(json.loads(state or '{}')))
+                    pipe.multi()
+                    pipe.hset(self.key, mapping={'version': version + 1, 'state': new_state})
+                    pipe.execute()
+                    break
+                except self._watch_error:
+                    continue
+        self._adopt(version + 1, new_state)
+
+
+class TokenManager:
+    """Process-wide MSAL client plus silent token acquisition per account"""
+
+    def __init__(self, client_id, authority, client_credential, scopes, cache_path,
+                 app_factory=ConfidentialClientApplication, redis_url=None):
+        self.client_id = client_id
+        self.authority = authority
+        self.client_credential = client_credential
+        self.scopes = scopes
+        self.cache_path = cache_path
+        self.redis_url = redis_url  # when set, tokens live in Redis instead of cache_path
+        self.app_factory = app_factory
+        self._cache = None
+        self._app = None
+        # Guards building the client and syncing the cache with its store. MSAL calls that may
+        # reach Azure AD run outside it so one slow refresh does not stall every user
+        self._lock = threading.RLock()
+
+    @property
+    def msal_app(self):
+        with self._lock:
+            if self._app is None:
+                self._cache = (RedisTokenCache(self.redis_url) if self.redis_url
+                               else SqliteTokenCache(self.cache_path))
+                self._cache.reload_if_stale()
+                self._app = self.app_factory(self.client_id, authority=self.authority,
+                                             client_credential=self.client_credential,
+                                             token_cache=self._cache)
+            return self._app
+
+    def get_authorization_request_url(self, redirect_uri):
+        return self.msal_app.get_authorization_request_url(self.scopes, redirect_uri=redirect_uri)
+
+    def acquire_token_by_authorization_code(self, code, redirect_uri):
+        """Redeem an auth code; the result gains ``account_id`` for later silent calls"""
+        msal_app = self.msal_app
+        result = msal_app.acquire_token_by_authorization_code(code, scopes=self.scopes, redirect_uri=redirect_uri)
+        if 'access_token' in result:
+            username = (result.get('id_token_claims') or {}).get('preferred_username')
+            accounts = msal_app.get_accounts(username=username) if username else []
+            if accounts:
+                result['account_id'] = accounts[0]['home_account_id']
+            with self._lock:
+                self._cache.save()
+        return result
+
+    def _find_account(self, account_id):
+        for account in self.msal_app.get_accounts():
+            if account.get('home_account_id') == account_id:
+                return account
+        return None
+
+    def acquire_token_silent(self, account_id, force_refresh=False):
+        """Return a token result from cache, refreshing it if needed, or None"""
+        if not account_id:
+            return None
+        msal_app = self.msal_app
+        with self._lock:
+            self._cache.reload_if_stale()
+        account = self._find_account(account_id)
+        if account is None:
+            return None
+        result = msal_app.acquire_token_silent(self.scopes, account=account, force_refresh=force_refresh)
+        with self._lock:
+            self._cache.save()
+        if result and 'access_token' in result:
+            return result
+        if result:
+            logger.warning(f"Silent token acquisition failed: {result.get('error_description', result.get('error'))}")
+        return None
+
+    def remove_account(self, account_id):
+        if not account_id:
+            return
+        with self._lock:
+            msal_app = self.msal_app
+
+            def remove(cache):
+                account = self._find_account(account_id)
+                if account:
+                    msal_app.remove_account(account)
+            self._cache.replace(remove)
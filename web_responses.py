@@ -0,0 +1,133 @@
+"""Fast JSON encoding, response compression and ETag revalidation.
+
+* ``dumps`` uses orjson when it is installed and compact ``json`` otherwise;
+  ``FastJSONProvider`` plugs the same encoder into ``jsonify``.
+* ``CachedBody`` keeps a serialized payload with its ETag and lazily built
+  gzip/brotli variants, so an unchanged payload is compressed only once.
+* ``cached_response`` answers ``If-None-Match`` with 304 and otherwise sends
+  the best encoding the client accepts.
+* ``init_app`` compresses other large HTML and JSON responses on the fly.
+
+Brotli is used only when the ``brotli`` package is available.
+"""
+import gzip
+import hashlib
+import json
+
+from flask import current_app, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'text/html', 'text/plain', 'text/css', 'application/javascript')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def dumps(obj):
+    """Serialize to compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """``jsonify`` backed by orjson when available, falling back to Flask's encoder"""
+
+    def dumps(self, obj, **kwargs):
+        # response() always asks for compact separators, or indent=2 in debug mode; orjson
+        # output is already compact and can indent by 2, so only other options need json
+        layout = {k: kwargs[k] for k in ('separators', 'indent') if k in kwargs}
+        if orjson is None or len(layout) < len(kwargs) or layout.get('indent') not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_SORT_KEYS if self.sort_keys else 0
+        if layout.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, option=option).decode()
+        except TypeError:
+            # Types orjson does not know (Decimal, Markup, ...) go through Flask's default hook
+            return super().dumps(obj, **kwargs)
+
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding():
+    """Preferred content coding for the current request, or None for identity"""
+    accepted = request.accept_encodings
+    best = max(available_encodings(), key=accepted.quality)
+    return best if accepted.quality(best) > 0 else None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CachedBody:
+    """A serialized response body with a content-derived ETag and memoized encodings"""
+
+    def __init__(self, data, mimetype='application/json'):
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(data, digest_size=16).hexdigest()
+        self._encoded = {}
+
+    def encoded(self, encoding):
+        if encoding is None or len(self.data) < COMPRESS_MIN_BYTES:
+            return self.data, None
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = self._encoded[encoding] = compress(self.data, encoding)
+        return body, encoding
+
+
+def cached_response(body):
+    """Response for a CachedBody: 304 when the client's copy is current, else the negotiated encoding"""
+    response = current_app.response_class(status=200, mimetype=body.mimetype)
+    response.set_etag(body.etag, weak=True)
+    # Per-user data: clients may keep it but must revalidate each time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Accept-Encoding')
+    if request.if_none_match.contains_weak(body.etag):
+        response.status_code = 304
+        return response
+    data, encoding = body.encoded(negotiate_encoding())
+    response.set_data(data)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def compress_response(response):
+    """after_request hook: compress large textual responses the client accepts"""
+    if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding()
+    response.vary.add('Accept-Encoding')
+    if encoding:
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_app(app):
+    app.json = FastJSONProvider(app)
+    app.after_request(compress_response)